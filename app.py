@@ -1,16 +1,46 @@
 import os
 import requests
 import streamlit as st
-from typing import List, Dict, Any, Tuple
+import streamlit.components.v1 as components
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
 import unicodedata
 from dotenv import load_dotenv
-from urllib.parse import quote
-import textwrap
+from urllib.parse import quote, urlsplit, parse_qsl
+from email.utils import parsedate_to_datetime
+import time
+import threading
+import functools
+import copy
+import bisect
+import re
+import json
+import sqlite3
+import pickle
+import tempfile
+import csv
+import io
+import asyncio
+import importlib.util
+import hmac
+import logging
+import cProfile
+import pstats
+import contextlib
 import pandas as pd
-from io import BytesIO
-from datetime import datetime
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+import pyarrow as pa
+import pyarrow.parquet as pq
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+try:
+    import httpx  # opcional: só necessário com HTTP_CLIENT=async
+except ImportError:
+    httpx = None
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -20,6 +50,184 @@ load_dotenv()
 # ---------------------------
 st.set_page_config(page_title="Pacientes", page_icon="🩺", layout="wide")
 API_URL = os.getenv("API_URL", "").rstrip("/")  # ex: https://sua.api
+PDF_URL_WORKERS = int(os.getenv("PDF_URL_WORKERS", "8"))  # consultas simultâneas a /pdfs/download (todas as sessões)
+PDF_URL_DEADLINE = float(os.getenv("PDF_URL_DEADLINE", "6"))  # prazo (s) para resolver os PDFs de uma página
+PDF_URL_TTL = 600  # (s) validade das URLs de download de PDF em cache
+PDF_BATCH_RETRY_AFTER = 3600  # (s) até tentar de novo o endpoint em lote quando a API não o suporta
+BACKGROUND_MAX_INFLIGHT = int(os.getenv("BACKGROUND_MAX_INFLIGHT", "4"))  # tarefas de prefetch simultâneas (todas as sessões)
+LOCAL_INDEX = os.getenv("LOCAL_INDEX", "").strip().lower() in ("1", "true", "sim")  # busca instantânea em memória
+LOCAL_INDEX_REFRESH = int(os.getenv("LOCAL_INDEX_REFRESH", "900"))  # (s) recarga completa, só se a API não suportar sincronização incremental
+LOCAL_INDEX_SYNC = int(os.getenv("LOCAL_INDEX_SYNC", "60"))  # (s) intervalo entre sincronizações incrementais do índice
+PAGE_SIZE = max(1, int(os.getenv("PAGE_SIZE", "25")))  # itens por página na listagem (enviado à API como ?limit=)
+SCAN_PAGE_SIZE = max(1, int(os.getenv("SCAN_PAGE_SIZE", "500")))  # itens por requisição nas leituras completas (exportação, índice local)
+PAGE_CURSORS_MAX = 5000  # cursores de página (keyset) lembrados, de todas as buscas (LRU)
+LIST_MODE = os.getenv("LIST_MODE", "pages").strip().lower()  # "pages" (links ?page=) ou "scroll" (lista virtualizada que carrega páginas sob demanda)
+SEARCH_WORKERS = max(1, int(os.getenv("SEARCH_WORKERS", "8")))  # buscas da listagem à espera da API (todas as sessões)
+NAV_MODE = os.getenv("NAV_MODE", "links").strip().lower()  # "links" (cada clique recarrega a página) ou "session" (links internos aplicados na mesma sessão)
+API_CACHE_PATH = os.getenv("API_CACHE_PATH", "")  # arquivo SQLite do cache persistente, criado com permissão 0600 (vazio = só memória)
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "180"))  # (s) idade até a resposta ser considerada velha
+API_CACHE_MAX_STALE = int(os.getenv("API_CACHE_MAX_STALE", "3600"))  # (s) expiração dura: idade máxima servida enquanto revalida (0 = TTL simples)
+API_CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # limite do arquivo (LRU)
+PATIENT_RECORDS_MAX = int(os.getenv("PATIENT_RECORDS_MAX", "5000"))  # pacientes mantidos no cache de registros (LRU)
+HTML_FRAGMENTS_MAX = int(os.getenv("HTML_FRAGMENTS_MAX", "4000"))  # fragmentos HTML memorizados (cards, páginas, detalhes; LRU)
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "2000"))  # limite do cache em memória (LRU)
+PDF_LINK_MODE = os.getenv("PDF_LINK_MODE", "eager").strip().lower()  # "eager" (todos os links prontos ao abrir o detalhe) ou "lazy" (sob demanda, um clique a mais por PDF)
+HTTP_CLIENT = os.getenv("HTTP_CLIENT", "sync").strip().lower()  # "sync" (requests) ou "async" (httpx em event loop próprio, HTTP/2 se houver h2)
+HTTP_TIMEOUT = 12  # (s) timeout de cada requisição à API
+HTTP_RETRY_TOTAL = 3  # tentativas extras por requisição
+HTTP_RETRY_BACKOFF = 0.3  # fator do backoff exponencial entre tentativas
+HTTP_RETRY_STATUS = frozenset([429, 500, 502, 503, 504])  # status que disparam nova tentativa (só GET)
+HTTP_RETRY_AFTER_MAX = 5  # (s) Retry-After acima disso não é esperado na requisição: abre o circuito pelo tempo pedido
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))  # requisições seguidas com falha que abrem o circuito
+CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))  # (s) circuito aberto antes de liberar uma sondagem
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))  # retries por requisição na janela (todas as sessões)
+RETRY_BUDGET_MIN = 10  # retries sempre permitidos por janela, mesmo com pouco tráfego
+RETRY_BUDGET_WINDOW = 60  # (s) janela do orçamento de retries
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # libera a página de métricas em ?admin=<token> (vazio = desativada)
+PROFILE = os.getenv("PROFILE", "").strip().lower()  # perfil de cada rerun: "timing", "cprofile" ou "pyinstrument" (vazio = desligado)
+PROFILE_QUERY_PARAM = os.getenv("PROFILE_QUERY_PARAM", "").strip().lower() in ("1", "true", "sim")  # aceita ?profile=<modo> (só em ambientes internos)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")  # pasta onde gravar o perfil de cada rerun (.prof / .html)
+
+# ---------------------------
+# Perfil de execução (opt-in)
+# ---------------------------
+PROFILE_MODES = ("timing", "cprofile", "pyinstrument")
+PROFILE_PHASES = ("url", "fetch", "normalize", "html", "markdown")
+
+class RerunProfile:
+    """
+    Tempos por fase de um rerun (url, fetch, normalize, html, markdown) e,
+    nos modos cprofile/pyinstrument, o perfil completo da thread do script.
+    """
+
+    def __init__(self, modo: str):
+        self.modo = modo
+        self.thread = threading.current_thread()
+        self.fases = {}
+        self.profiler = None
+        self.total = 0.0
+        self.parado = False
+        if modo == "cprofile":
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Python 3.12+: outro profiler já ativo no processo (ex.: outra sessão perfilando)
+                self.profiler, self.modo = None, "timing"
+        elif modo == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self.modo = "timing"
+            else:
+                self.profiler = Profiler()
+                try:
+                    self.profiler.start()
+                except (RuntimeError, ValueError):
+                    self.profiler, self.modo = None, "timing"
+        self.inicio = time.perf_counter()
+
+    def add(self, fase: str, segundos: float) -> None:
+        total, chamadas = self.fases.get(fase, (0.0, 0))
+        self.fases[fase] = (total + segundos, chamadas + 1)
+
+    def stop(self) -> None:
+        if self.parado:
+            return
+        self.parado = True
+        self.total = time.perf_counter() - self.inicio
+        if self.modo == "cprofile":
+            self.profiler.disable()
+        elif self.modo == "pyinstrument":
+            self.profiler.stop()
+
+@st.cache_resource(show_spinner=False)
+def get_active_profiles() -> Dict[str, Any]:
+    """Perfil ainda ativo por thread do script (reruns interrompidos não chegam a render_rerun_profile)."""
+    return {"lock": threading.Lock(), "ativos": {}}
+
+def start_rerun_profile() -> Any:
+    """
+    Inicia o perfil deste rerun se PROFILE (ou ?profile=, com PROFILE_QUERY_PARAM)
+    pedir um modo válido. Antes, encerra o perfil que um rerun anterior desta
+    thread deixou ativo (st.rerun, st.stop ou interrupção antes do fim da página):
+    só um profiler pode estar ligado por vez.
+    """
+    ativos = get_active_profiles()
+    atual = threading.current_thread()
+    with ativos["lock"]:
+        sobras = [t for t in ativos["ativos"] if t is atual or not t.is_alive()]
+        sobras = [ativos["ativos"].pop(t) for t in sobras]
+    for anterior in sobras:
+        anterior.stop()
+
+    modo = PROFILE
+    if PROFILE_QUERY_PARAM:
+        modo = st.query_params.get("profile", modo).strip().lower()
+    if modo in ("1", "true", "sim"):
+        modo = "timing"
+    if modo not in PROFILE_MODES:
+        return None
+    perfil = RerunProfile(modo)
+    with ativos["lock"]:
+        ativos["ativos"][atual] = perfil
+    return perfil
+
+_rerun_profile = start_rerun_profile()
+
+@contextlib.contextmanager
+def profile_phase(fase: str):
+    """Soma o tempo do bloco à fase do perfil do rerun (só na thread do script; no-op sem perfil)."""
+    perfil = _rerun_profile
+    if perfil is None or threading.current_thread() is not perfil.thread:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.add(fase, time.perf_counter() - inicio)
+
+def render_rerun_profile() -> None:
+    """Encerra o perfil do rerun e mostra as fases (e o perfil completo, se houver) ao final da página."""
+    perfil = _rerun_profile
+    if perfil is None:
+        return
+    perfil.stop()
+    ativos = get_active_profiles()
+    with ativos["lock"]:
+        if ativos["ativos"].get(perfil.thread) is perfil:
+            del ativos["ativos"][perfil.thread]
+
+    conteudo, extensao = None, ""
+    relatorio = ""
+    if perfil.modo == "cprofile":
+        with tempfile.NamedTemporaryFile(suffix=".prof") as tmp:
+            perfil.profiler.dump_stats(tmp.name)
+            with open(tmp.name, "rb") as f:
+                conteudo, extensao = f.read(), "prof"
+        texto = io.StringIO()
+        pstats.Stats(perfil.profiler, stream=texto).sort_stats("cumulative").print_stats(25)
+        relatorio = texto.getvalue()
+    elif perfil.modo == "pyinstrument":
+        conteudo, extensao = perfil.profiler.output_html().encode("utf-8"), "html"
+        relatorio = perfil.profiler.output_text(unicode=True)
+    if conteudo and PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"rerun-{datetime.now():%Y%m%d-%H%M%S-%f}.{extensao}"), "wb") as f:
+            f.write(conteudo)
+
+    with st.expander(f"⏱ Perfil deste rerun: {perfil.total * 1000:.0f} ms"):
+        linhas = [
+            {"Fase": fase, "ms": round(segundos * 1000, 1), "Chamadas": chamadas, "% do rerun": round(100 * segundos / max(perfil.total, 1e-9), 1)}
+            for fase, (segundos, chamadas) in sorted(perfil.fases.items(), key=lambda item: PROFILE_PHASES.index(item[0]))
+        ]
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+        st.caption("A normalização acontece dentro do fetch (só quando o cache erra); seus tempos também somam em fetch.")
+        if relatorio:
+            st.code(relatorio, language="text")
+        if conteudo:
+            st.download_button(f"Baixar perfil (.{extensao})", conteudo, file_name=f"rerun.{extensao}", key="profile_download")
 
 # ---------------------------
 # Estilo (CSS para cards)
@@ -590,7 +798,8 @@ div[data-testid="stHorizontalBlock"]:has(input[placeholder*="Digite o nome do pa
 
 </style>
 """
-st.markdown(CARD_CSS, unsafe_allow_html=True)
+with profile_phase("markdown"):
+    st.markdown(CARD_CSS, unsafe_allow_html=True)
 
 # ---------------------------
 # Utilidades
@@ -603,23 +812,826 @@ def normalize(s: str) -> str:
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
     return s.lower().strip()
 
+def attach_background_ctx(ctx: Any) -> None:
+    """
+    Associa à thread atual uma cópia do ScriptRunContext da sessão. O cache do
+    Streamlit só lê entradas com um contexto presente; a cópia evita que o flag
+    de "widget dentro de função cacheada" ligado pela thread vaze para o script.
+    """
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), copy.copy(ctx))
+
+# ---------------------------
+# Métricas (formato de texto do Prometheus)
+# ---------------------------
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # (s)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)  # (bytes)
+
+METRIC_HELP = {
+    "app_http_request_duration_seconds": ("histogram", "Duração de cada tentativa de requisição à API."),
+    "app_http_response_bytes": ("histogram", "Tamanho do corpo das respostas da API."),
+    "app_http_requests_total": ("counter", "Tentativas por endpoint e resultado (status HTTP ou classe do erro)."),
+    "app_http_retries_total": ("counter", "Retries feitos por endpoint."),
+    "app_fetch_errors_total": ("counter", "Erros tratados silenciosamente nas funções de busca, por classe."),
+    "app_response_cache_total": ("counter", "Consultas ao cache de respostas: fresh, stale, offline ou miss."),
+    "app_cache_data_requests_total": ("counter", "Chamadas às funções com st.cache_data: hit ou miss."),
+    "app_single_flight_calls_total": ("counter", "Chamadas do single-flight: calls, executed e shared."),
+    "app_circuit_open": ("gauge", "1 se o circuito da API está aberto."),
+}
+
+class Metrics:
+    """Contadores e histogramas do processo, compartilhados entre sessões."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, labels: Dict[str, Any], value: float = 1) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Dict[str, Any], value: float, buckets: Tuple[float, ...]) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            indice = bisect.bisect_left(buckets, value)
+            if indice < len(buckets):
+                hist["counts"][indice] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def snapshot(self) -> Tuple[Dict[Any, float], Dict[Any, Dict[str, Any]]]:
+        with self._lock:
+            return dict(self.counters), copy.deepcopy(self.histograms)
+
+@st.cache_resource(show_spinner=False)
+def get_metrics() -> Metrics:
+    return Metrics()
+
+def metric_endpoint(url: str) -> str:
+    """Rótulo do endpoint: só o caminho da URL (sem query string, que levaria ids aos rótulos)."""
+    return urlsplit(url).path or "/"
+
+def record_fetch_error(origem: str, exc: Exception) -> None:
+    """Conta um erro que a função de busca trata sem exibir (a tela segue com o fallback)."""
+    get_metrics().inc("app_fetch_errors_total", {"function": origem, "error": type(exc).__name__})
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    partes = []
+    for k, v in labels:
+        v = v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+def render_metrics() -> str:
+    """Todas as métricas no formato de texto do Prometheus (exposition format 0.0.4)."""
+    counters, histograms = get_metrics().snapshot()
+
+    # st.cache_data não expõe hits: o que passa pelo single-flight e não chega ao
+    # response_cache (chamado só em miss) foi servido pelo st.cache_data
+    sf_stats = single_flight_stats()
+    misses = {}
+    for (name, labels), valor in counters.items():
+        if name == "app_response_cache_total":
+            funcao = dict(labels)["function"]
+            misses[funcao] = misses.get(funcao, 0) + valor
+    for funcao, stats in sf_stats.items():
+        for kind, valor in stats.items():
+            counters[("app_single_flight_calls_total", (("function", funcao), ("kind", kind)))] = valor
+        miss = misses.get(funcao, 0)
+        counters[("app_cache_data_requests_total", (("function", funcao), ("result", "hit")))] = max(0, stats["executed"] - miss)
+        counters[("app_cache_data_requests_total", (("function", funcao), ("result", "miss")))] = miss
+    counters[("app_circuit_open", ())] = int(api_circuit_open())
+
+    linhas = []
+    for name, (tipo, ajuda) in METRIC_HELP.items():
+        linhas.append(f"# HELP {name} {ajuda}")
+        linhas.append(f"# TYPE {name} {tipo}")
+        if tipo == "histogram":
+            for (h_name, labels), hist in sorted(histograms.items()):
+                if h_name != name:
+                    continue
+                acumulado = 0
+                for limite, qtd in zip(hist["buckets"], hist["counts"]):
+                    acumulado += qtd
+                    linhas.append(f"{name}_bucket{_format_labels(labels + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                linhas.append(f"{name}_sum{_format_labels(labels)} {hist['sum']:.6f}")
+                linhas.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+        else:
+            for (c_name, labels), valor in sorted(counters.items()):
+                if c_name == name:
+                    linhas.append(f"{name}{_format_labels(labels)} {valor}")
+    return "\n".join(linhas) + "\n"
+
+def render_admin_page() -> None:
+    """Página de métricas (?admin=<ADMIN_TOKEN>): resumo por endpoint e o texto completo no formato Prometheus."""
+    st.subheader("Métricas")
+    counters, histograms = get_metrics().snapshot()
+    resumo = []
+    for (name, labels), hist in sorted(histograms.items()):
+        if name != "app_http_request_duration_seconds":
+            continue
+        rotulos = dict(labels)
+        falhas = sum(
+            valor for (c_name, c_labels), valor in counters.items()
+            if c_name == "app_http_requests_total"
+            and dict(c_labels).get("endpoint") == rotulos["endpoint"]
+            and not dict(c_labels).get("status", "").startswith(("2", "3"))
+        )
+        retries = counters.get(("app_http_retries_total", (("endpoint", rotulos["endpoint"]),)), 0)
+        resumo.append({
+            "Endpoint": f"{rotulos['method']} {rotulos['endpoint']}",
+            "Tentativas": hist["count"],
+            "Latência média (ms)": round(1000 * hist["sum"] / max(1, hist["count"])),
+            "Retries": retries,
+            "Falhas": falhas,
+        })
+    if api_circuit_open():
+        st.warning("Circuito da API aberto: requisições estão sendo evitadas.")
+    if HTTP_CLIENT == "async" and httpx is None:
+        st.warning("HTTP_CLIENT=async, mas o httpx não está instalado: as requisições usam requests.")
+    if resumo:
+        st.dataframe(pd.DataFrame(resumo), hide_index=True, use_container_width=True)
+    else:
+        st.info("Nenhuma requisição registrada ainda.")
+    texto = render_metrics()
+    st.download_button("Baixar métricas (Prometheus)", texto, file_name="metrics.prom", mime="text/plain")
+    st.code(texto, language="text")
+
 @st.cache_resource(show_spinner=False)
 def get_http_session() -> requests.Session:
-    """Cria uma sessão HTTP reutilizável com pool e retries."""
+    """Cria uma sessão HTTP reutilizável com pool (os retries ficam em api_request)."""
     session = requests.Session()
-    retries = Retry(
-        total=3,
-        backoff_factor=0.3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=frozenset(["GET"]),
-    )
-    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retries)
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=0)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     session.headers.update({"Connection": "keep-alive"})
     return session
 
-@st.cache_data(show_spinner=False, ttl=180)
+@st.cache_resource(show_spinner=False)
+def get_async_http_client() -> Dict[str, Any]:
+    """
+    Cliente httpx assíncrono rodando num event loop dedicado (thread daemon),
+    compartilhado entre sessões. Usa HTTP/2 quando o pacote h2 está instalado,
+    multiplexando as requisições simultâneas numa mesma conexão.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="http-async-loop", daemon=True).start()
+    http2 = importlib.util.find_spec("h2") is not None
+
+    async def _create():
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+
+    client = asyncio.run_coroutine_threadsafe(_create(), loop).result()
+    return {"loop": loop, "client": client, "http2": http2}
+
+@st.cache_resource(show_spinner=False)
+def warn_async_client_unavailable() -> bool:
+    """Registra uma única vez no log do servidor que HTTP_CLIENT=async caiu para requests."""
+    logging.getLogger(__name__).warning(
+        "HTTP_CLIENT=async, mas o pacote httpx não está instalado: usando requests (instale httpx[http2])."
+    )
+    return True
+
+if HTTP_CLIENT == "async" and httpx is None:
+    warn_async_client_unavailable()
+
+class CircuitOpenError(requests.ConnectionError):
+    """Requisição recusada sem chamar a API: o circuito está aberto."""
+
+class CircuitBreaker:
+    """
+    Circuito da API, compartilhado entre sessões:
+    - fechado: as requisições passam; CIRCUIT_FAILURES falhas seguidas abrem o circuito;
+    - aberto: as requisições falham na hora (CircuitOpenError) por CIRCUIT_RESET s,
+      ou pelo Retry-After de um 429/503 quando maior que HTTP_RETRY_AFTER_MAX;
+    - meio-aberto: passa uma única requisição de sondagem; sucesso fecha, falha reabre.
+    Também controla o orçamento de retries: no máximo RETRY_BUDGET_RATIO retries
+    por requisição na última janela de RETRY_BUDGET_WINDOW s (mínimo RETRY_BUDGET_MIN).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now: float) -> None:
+        for fila in (self._requests, self._retries):
+            while fila and now - fila[0] > RETRY_BUDGET_WINDOW:
+                fila.popleft()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == "open" and time.time() < self.open_until
+
+    def allow(self) -> bool:
+        """Se a requisição pode ir à API agora (no meio-aberto, só a sondagem)."""
+        with self._lock:
+            now = time.time()
+            if self.state == "open":
+                if now < self.open_until:
+                    return False
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open":
+                if self.probing:
+                    return False
+                self.probing = True
+            self._trim(now)
+            self._requests.append(now)
+            return True
+
+    def allow_retry(self) -> bool:
+        """Consome uma unidade do orçamento de retries (negado fora do estado fechado)."""
+        with self._lock:
+            if self.state != "closed":
+                return False
+            now = time.time()
+            self._trim(now)
+            if len(self._retries) >= max(RETRY_BUDGET_MIN, RETRY_BUDGET_RATIO * len(self._requests)):
+                return False
+            self._retries.append(now)
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, retry_after: float = 0.0) -> None:
+        with self._lock:
+            now = time.time()
+            self.failures += 1
+            self.probing = False
+            if self.state == "half_open" or self.failures >= CIRCUIT_FAILURES:
+                self.state = "open"
+                self.open_until = max(self.open_until, now + CIRCUIT_RESET)
+            if retry_after > HTTP_RETRY_AFTER_MAX:
+                self.state = "open"
+                self.open_until = max(self.open_until, now + retry_after)
+
+    def release(self) -> None:
+        """Libera a vaga de sondagem quando a requisição é interrompida sem resultado."""
+        with self._lock:
+            self.probing = False
+
+@st.cache_resource(show_spinner=False)
+def get_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker()
+
+def api_circuit_open() -> bool:
+    """Se a API está sendo evitada no momento (o app serve o que houver em cache)."""
+    return get_circuit_breaker().is_open()
+
+def _retry_after(resp: Any) -> float:
+    """Segundos pedidos pelo header Retry-After de um 429/503, em segundos ou data HTTP (0 se ausente)."""
+    if resp is None or resp.status_code not in (429, 503):
+        return 0.0
+    retry_after = resp.headers.get("Retry-After", "").strip()
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        quando = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError, IndexError):
+        return 0.0
+    if quando.tzinfo is None:
+        quando = quando.replace(tzinfo=timezone.utc)  # "-0000": data HTTP sem fuso explícito é GMT
+    return max(0.0, (quando - datetime.now(timezone.utc)).total_seconds())
+
+def _retry_delay(attempt: int, retry_after: float = 0.0) -> float:
+    """Espera antes da tentativa seguinte: Retry-After, se houver, ou backoff exponencial."""
+    if retry_after:
+        return retry_after
+    if attempt <= 1:
+        return 0.0
+    return min(HTTP_RETRY_BACKOFF * (2 ** (attempt - 1)), 120.0)
+
+def _as_requests_response(resp: Any) -> requests.Response:
+    """Converte uma resposta httpx em requests.Response (raise_for_status/json idênticos para os chamadores)."""
+    converted = requests.Response()
+    converted.status_code = resp.status_code
+    converted.headers.update(resp.headers)
+    converted.url = str(resp.url)
+    converted.reason = resp.reason_phrase
+    converted.encoding = resp.encoding
+    converted._content = resp.content
+    return converted
+
+def _send(method: str, url: str, **kwargs) -> requests.Response:
+    """Uma única tentativa, pela sessão requests ou pelo cliente httpx (HTTP_CLIENT=async)."""
+    if HTTP_CLIENT != "async" or httpx is None:
+        return get_http_session().request(method, url, **kwargs)
+
+    async_client = get_async_http_client()
+    future = asyncio.run_coroutine_threadsafe(
+        async_client["client"].request(method, url, **kwargs), async_client["loop"]
+    )
+    try:
+        # Prazo externo folgado: o timeout da requisição é do httpx
+        resp = future.result(timeout=kwargs["timeout"] + 30)
+    except httpx.TimeoutException as exc:
+        raise requests.Timeout(str(exc)) from exc
+    except httpx.TransportError as exc:
+        raise requests.ConnectionError(str(exc)) from exc
+    except TimeoutError as exc:
+        future.cancel()
+        raise requests.Timeout(str(exc)) from exc
+    except httpx.HTTPError as exc:
+        raise requests.RequestException(str(exc)) from exc
+    return _as_requests_response(resp)
+
+def api_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Ponto único de acesso HTTP à API. Devolve requests.Response e levanta
+    exceções de requests em qualquer cliente, de modo que o tratamento de erros
+    dos chamadores não muda.
+    Retries: erros de conexão em qualquer método; erros de leitura e status de
+    HTTP_RETRY_STATUS só em GET; até HTTP_RETRY_TOTAL por requisição, limitados
+    pelo orçamento do circuito. Com o circuito aberto, levanta CircuitOpenError
+    sem tocar a rede (as funções fetch_* caem para o cache).
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    breaker = get_circuit_breaker()
+    metrics = get_metrics()
+    rotulos = {"endpoint": metric_endpoint(url), "method": method}
+    if not breaker.allow():
+        metrics.inc("app_http_requests_total", {**rotulos, "status": "CircuitOpenError"})
+        raise CircuitOpenError(f"API indisponível (circuito aberto): {url}")
+
+    attempt = 0
+    concluido = False
+    try:
+        while True:
+            erro = None
+            resp = None
+            inicio = time.perf_counter()
+            try:
+                resp = _send(method, url, **kwargs)
+            except requests.RequestException as exc:
+                erro = exc
+            metrics.observe("app_http_request_duration_seconds", rotulos, time.perf_counter() - inicio, LATENCY_BUCKETS)
+            metrics.inc("app_http_requests_total", {**rotulos, "status": type(erro).__name__ if erro else resp.status_code})
+
+            if erro is not None:
+                retentavel = method == "GET" or isinstance(erro, requests.ConnectionError)
+            else:
+                metrics.observe("app_http_response_bytes", rotulos, len(resp.content), SIZE_BUCKETS)
+                # 501 indica recurso não suportado (ex.: lote de PDFs), não falha do servidor
+                if (resp.status_code < 500 and resp.status_code != 429) or resp.status_code == 501:
+                    breaker.record_success()
+                    concluido = True
+                    return resp
+                retentavel = method == "GET" and resp.status_code in HTTP_RETRY_STATUS
+
+            retry_after = _retry_after(resp)
+            if (
+                retentavel
+                and attempt < HTTP_RETRY_TOTAL
+                and retry_after <= HTTP_RETRY_AFTER_MAX
+                and breaker.allow_retry()
+            ):
+                attempt += 1
+                metrics.inc("app_http_retries_total", {"endpoint": rotulos["endpoint"]})
+                time.sleep(_retry_delay(attempt, retry_after))
+                continue
+
+            breaker.record_failure(retry_after)
+            concluido = True
+            if erro is not None:
+                raise erro
+            return resp
+    finally:
+        if not concluido:
+            breaker.release()
+
+def api_get(url: str, **kwargs) -> requests.Response:
+    """Atalho para api_request("GET", ...)."""
+    return api_request("GET", url, **kwargs)
+
+@st.cache_resource(show_spinner=False)
+def get_background_state() -> Dict[str, Any]:
+    """Pool compartilhado entre sessões para tarefas em segundo plano (prefetch etc.)."""
+    return {
+        "executor": ThreadPoolExecutor(max_workers=BACKGROUND_MAX_INFLIGHT, thread_name_prefix="background"),
+        "lock": threading.Lock(),
+        "inflight": set(),
+    }
+
+def submit_background(func, *args) -> bool:
+    """
+    Executa func(*args) em segundo plano, descartando pedidos idênticos já em
+    andamento e respeitando o limite de tarefas simultâneas. Usado para aquecer
+    os caches (st.cache_data) sem bloquear a renderização. Retorna se agendou.
+    """
+    state = get_background_state()
+    key = (getattr(func, "__qualname__", repr(func)), args)
+    with state["lock"]:
+        if key in state["inflight"] or len(state["inflight"]) >= BACKGROUND_MAX_INFLIGHT:
+            return False
+        state["inflight"].add(key)
+
+    ctx = get_script_run_ctx()
+
+    def _run():
+        attach_background_ctx(ctx)
+        try:
+            func(*args)
+        except Exception as exc:
+            record_fetch_error(key[0], exc)
+        finally:
+            with state["lock"]:
+                state["inflight"].discard(key)
+
+    state["executor"].submit(_run)
+    return True
+
+def background_pending(func, *args) -> bool:
+    """Se func(*args) já está agendada/em andamento em segundo plano (via submit_background)."""
+    state = get_background_state()
+    with state["lock"]:
+        return (getattr(func, "__qualname__", repr(func)), args) in state["inflight"]
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight_state() -> Dict[str, Any]:
+    """Chamadas em andamento e contadores do single-flight, compartilhados entre sessões."""
+    return {"lock": threading.Lock(), "inflight": {}, "stats": {}}
+
+class UncachedResult(Exception):
+    """
+    Resultado que não deve ficar no st.cache_data (erro da API ou valor de
+    fallback): response_cache o levanta por baixo do cache, que não guarda
+    exceções, e single_flight, por cima, o devolve como valor normal.
+    """
+
+    def __init__(self, valor: Any):
+        super().__init__()
+        self.valor = valor
+
+def _call_uncached(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except UncachedResult as exc:
+        return exc.valor
+
+def single_flight(func):
+    """
+    Decorator: chamadas simultâneas com os mesmos argumentos (de qualquer sessão)
+    compartilham uma única execução de func. A primeira executa; as demais
+    aguardam e recebem uma cópia do resultado. Se a primeira for interrompida
+    (ex.: rerun do Streamlit), cada uma das que aguardavam executa por conta própria.
+    Fica acima do st.cache_data e converte UncachedResult no valor devolvido.
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state = get_single_flight_state()
+        key = (name, args, tuple(sorted(kwargs.items())))
+        with state["lock"]:
+            stats = state["stats"].setdefault(name, {"calls": 0, "executed": 0, "shared": 0})
+            stats["calls"] += 1
+            call = state["inflight"].get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "ok": False, "result": None}
+                state["inflight"][key] = call
+                stats["executed"] += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["ok"]:
+                with state["lock"]:
+                    stats["shared"] += 1
+                return copy.deepcopy(call["result"])
+            return _call_uncached(func, *args, **kwargs)
+
+        try:
+            call["result"] = _call_uncached(func, *args, **kwargs)
+            call["ok"] = True
+            return call["result"]
+        finally:
+            with state["lock"]:
+                state["inflight"].pop(key, None)
+            call["done"].set()
+
+    wrapper.clear = getattr(func, "clear", None)
+    return wrapper
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores por função: chamadas, execuções efetivas e chamadas economizadas (shared)."""
+    state = get_single_flight_state()
+    with state["lock"]:
+        return copy.deepcopy(state["stats"])
+
+# ---------------------------
+# Cache de respostas (stale-while-revalidate, em memória ou SQLite)
+# ---------------------------
+class MemoryCache:
+    """Mesma interface do DiskCache, em memória do processo, limitado a max_entries (LRU)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        """Retorna (valor, idade_em_segundos) ou (None, -1) se não houver entrada."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, -1.0
+            self._entries.move_to_end(key)
+        # Cópia: quem chama pode alterar o resultado (ex.: resolve_pdf_urls)
+        return copy.deepcopy(entry[0]), max(0.0, time.time() - entry[1])
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(value), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+class DiskCache:
+    """
+    Cache chave/valor em SQLite que sobrevive a restarts/redeploys. Guarda o valor
+    (pickle) com o instante de gravação e do último acesso; ao passar de max_bytes
+    remove as entradas acessadas há mais tempo (LRU). Seguro entre threads.
+    O arquivo guarda dados de pacientes (prontuários, CPF, endereço): é criado, e
+    corrigido se já existir, com permissão 0600 (só o usuário do processo lê).
+    O tamanho total é mantido em memória; a soma no SQLite só é refeita ao despejar.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        for arquivo in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(arquivo):
+                os.chmod(arquivo, 0o600)  # o SQLite cria -wal/-shm com a permissão do banco
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._total = self._sum_sizes()
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        """Retorna (valor, idade_em_segundos) ou (None, -1) se não houver entrada."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, -1.0
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        try:
+            return pickle.loads(row[0]), max(0.0, time.time() - row[1])
+        except Exception:
+            self.delete(key)
+            return None, -1.0
+
+    def set(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        agora = time.time()
+        with self._lock:
+            anterior = self._size_of(key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), agora, agora),
+            )
+            self._total += len(blob) - anterior
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._total -= self._size_of(key)
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _size_of(self, key: str) -> int:
+        row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _sum_sizes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self) -> None:
+        if self._total <= self.max_bytes:
+            return
+        # Refaz a soma (outro processo pode compartilhar o arquivo) antes de despejar
+        self._total = self._sum_sizes()
+        if self._total <= self.max_bytes:
+            return
+        # Remove as menos acessadas até voltar a 90% do limite (evita despejar a cada gravação)
+        excesso = self._total - int(self.max_bytes * 0.9)
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if excesso <= 0:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            excesso -= size
+            self._total -= size
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> Any:
+    """Instância única do cache de respostas: SQLite se API_CACHE_PATH estiver configurado, senão memória."""
+    if API_CACHE_PATH:
+        try:
+            return DiskCache(API_CACHE_PATH, API_CACHE_MAX_BYTES)
+        except (OSError, sqlite3.Error):
+            pass
+    return MemoryCache(API_CACHE_MAX_ENTRIES)
+
+def response_cache_key(name: str, args: Tuple[Any, ...]) -> str:
+    return json.dumps([name, list(args)], default=str, ensure_ascii=False)
+
+def response_cache_age(func, *args) -> float:
+    """Idade (s) da resposta cacheada de func(*args), ou -1 se não houver entrada."""
+    _, idade = get_response_cache().get(response_cache_key(func.__qualname__, args))
+    return idade
+
+def describe_cache_age(idade: float) -> str:
+    """Texto curto para exibir a idade de dados servidos do cache após o TTL ("" se ainda frescos)."""
+    if idade < 0 or idade <= API_CACHE_TTL:
+        return ""
+    minutos = int(idade // 60)
+    if minutos < 1:
+        quando = "menos de 1 min"
+    elif minutos < 60:
+        quando = f"{minutos} min"
+    else:
+        quando = f"{minutos // 60} h"
+    if api_circuit_open():
+        return f"API indisponível, exibindo dados de há {quando}"
+    return f"dados de há {quando}, atualizando em segundo plano"
+
+def response_cache(is_valid):
+    """
+    Decorator para as funções fetch_*, aplicado abaixo de st.cache_data (só é
+    consultado quando o TTL em memória expira ou após um restart).
+    - idade <= API_CACHE_TTL: devolve do cache sem chamar a API;
+    - idade <= API_CACHE_TTL + API_CACHE_MAX_STALE: devolve o valor velho na hora
+      e revalida em segundo plano (stale-while-revalidate); ao terminar, limpa a
+      entrada do st.cache_data para que o próximo rerun leia o valor novo. Se a
+      revalidação não puder ser agendada (pool de segundo plano cheio), busca na
+      hora, como na expiração dura;
+    - acima disso (expiração dura) a chamada bloqueia na API, exceto com o
+      circuito aberto (api_circuit_open), quando o valor guardado é servido;
+    - respostas de erro (is_valid(resultado) falso) não são gravadas e, se
+      houver valor velho, ele é servido no lugar.
+    Só respostas frescas chegam ao st.cache_data; erros e valores velhos voltam
+    por UncachedResult, para que o próximo rerun consulte de novo (e a API, assim
+    que o circuito fechar) em vez de repetir o fallback por um TTL inteiro.
+    """
+    def decorator(func):
+        name = func.__qualname__
+
+        def _refresh(*args):
+            resultado = func(*args)
+            if is_valid(resultado):
+                get_response_cache().set(response_cache_key(name, args), resultado)
+                cached = globals().get(name)
+                if getattr(cached, "clear", None):
+                    cached.clear(*args)
+
+        # Nome próprio por função: submit_background deduplica pelo nome + argumentos
+        _refresh.__qualname__ = f"{name}._refresh"
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            cache = get_response_cache()
+            if not args or not args[0]:
+                return func(*args)
+            key = response_cache_key(name, args)
+            valor, idade = cache.get(key)
+            if idade >= 0 and idade <= API_CACHE_TTL:
+                get_metrics().inc("app_response_cache_total", {"function": name, "result": "fresh"})
+                return valor
+            if idade >= 0 and idade <= API_CACHE_TTL + API_CACHE_MAX_STALE and (
+                api_circuit_open() or submit_background(_refresh, *args) or background_pending(_refresh, *args)
+            ):
+                get_metrics().inc("app_response_cache_total", {"function": name, "result": "stale"})
+                raise UncachedResult(valor)
+            # Valor velho sem revalidação agendada (pool de segundo plano cheio): segue para a
+            # chamada bloqueante abaixo
+            if idade >= 0 and api_circuit_open():
+                # API fora do ar: qualquer valor guardado é melhor que esperar a falha
+                get_metrics().inc("app_response_cache_total", {"function": name, "result": "offline"})
+                raise UncachedResult(valor)
+
+            get_metrics().inc("app_response_cache_total", {"function": name, "result": "miss"})
+            resultado = func(*args)
+            if is_valid(resultado):
+                cache.set(key, resultado)
+                return resultado
+            raise UncachedResult(valor if idade >= 0 else resultado)
+
+        return wrapper
+
+    return decorator
+
+# ---------------------------
+# Normalização de pacientes (mapeamento declarativo)
+# ---------------------------
+# Campo normalizado -> fontes na resposta da API, em ordem de preferência: vale a
+# primeira não vazia, senão "". Uma fonte em tupla junta com "/" as partes preenchidas.
+PATIENT_SCHEMA = (
+    ("id", ("id",)),
+    ("nome", ("nome",)),
+    ("nascimento", ("nascimento",)),
+    ("celular", ("celular", "telefone")),  # "telefone" no formato antigo
+    ("telefone_residencial", ("telefone_residencial",)),
+    ("email", ("email",)),
+    ("profissao", ("profissao",)),
+    ("cpf", ("cpf",)),
+    ("endereco", ("endereco",)),
+    ("cidade_estado", (("cidade", "estado"), "cidade_estado")),  # "cidade_estado" no formato antigo
+    ("cep", ("cep",)),
+    ("observacao", ("observacao",)),
+    ("como_conheceu", ("como_conheceu",)),
+)
+PATIENT_RAW_FIELDS = ("id",)  # repassados como vieram (id ausente continua None)
+
+def _join_parts(*partes: Any) -> str:
+    return "/".join(str(parte) for parte in partes if parte)
+
+def _field_getter(campo: str, fontes: Tuple[Any, ...]):
+    """
+    Monta, uma vez, a função get -> valor de um campo do schema: a primeira fonte
+    preenchida (tuplas unidas com "/"), senão "" (ou o valor bruto, em PATIENT_RAW_FIELDS).
+    O caso comum, uma única chave, vira um item.get direto.
+    """
+    bruto = campo in PATIENT_RAW_FIELDS
+    if len(fontes) == 1 and not isinstance(fontes[0], tuple):
+        chave = fontes[0]
+        if bruto:
+            return lambda get: get(chave)
+        return lambda get: get(chave) or ""
+
+    def obter(get):
+        valor = None
+        for fonte in fontes:
+            valor = _join_parts(*map(get, fonte)) if isinstance(fonte, tuple) else get(fonte)
+            if valor:
+                return valor
+        return valor if bruto else ""
+
+    return obter
+
+PATIENT_GETTERS = tuple((campo, _field_getter(campo, fontes)) for campo, fontes in PATIENT_SCHEMA)
+
+def normalize_patient(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza um paciente vindo da API segundo PATIENT_SCHEMA (via PATIENT_GETTERS)."""
+    get = item.get
+    return {campo: obter(get) for campo, obter in PATIENT_GETTERS}
+
+def normalize_patients(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normaliza um lote de pacientes (lista, detalhe, índice e exportação usam o mesmo schema)."""
+    return [normalize_patient(item) for item in items if isinstance(item, dict)]
+
+@st.cache_resource(show_spinner=False)
+def get_page_cursors() -> Dict[str, Any]:
+    """Cursor (keyset) de cada página já alcançada, por (api, nome, página), compartilhado entre sessões."""
+    return {"lock": threading.Lock(), "cursors": OrderedDict()}
+
+def remember_page_cursor(api_base_url: str, nome: str, page: int, cursor: str) -> None:
+    store = get_page_cursors()
+    chave = (api_base_url, nome, page)
+    with store["lock"]:
+        store["cursors"][chave] = cursor
+        store["cursors"].move_to_end(chave)
+        while len(store["cursors"]) > PAGE_CURSORS_MAX:
+            store["cursors"].popitem(last=False)
+
+def known_page_cursor(api_base_url: str, nome: str, page: int) -> str:
+    """Cursor para pedir a página por keyset, ou "" se ela ainda não foi alcançada a partir da anterior."""
+    store = get_page_cursors()
+    with store["lock"]:
+        return store["cursors"].get((api_base_url, nome, page), "")
+
+@single_flight
+@st.cache_data(show_spinner=False, ttl=API_CACHE_TTL)
+@response_cache(lambda resultado: not resultado[1].get("error"))
 def fetch_patients(api_base_url: str, nome: str, page: int = 1) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
     Busca pacientes na API: GET {API_URL}/pacientes?nome=<nome>&page=<page>
@@ -631,6 +1643,24 @@ def fetch_patients(api_base_url: str, nome: str, page: int = 1) -> Tuple[List[Di
       "version": "pacientes-v2-only-endpoint"
     }
     Retorna (lista_de_pacientes, meta)
+
+    Páginas alcançadas a partir da anterior são pedidas pelo cursor que ela
+    devolveu (?cursor=, paginação keyset), se a API o fornecer; saltos diretos
+    para páginas distantes usam ?page=.
+    """
+    return load_patients_page(api_base_url, nome, page, cursor=known_page_cursor(api_base_url, nome, page))
+
+def load_patients_page(api_base_url: str, nome: str, page: int = 1, updated_since: str = "", cursor: str = "", limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Mesma busca de fetch_patients, sem cache (a exportação completa não deve reter
+    todas as páginas em memória). Com updated_since, pede só os pacientes alterados
+    desde o cursor; se a API suportar, o meta traz "cursor" e "deleted".
+
+    Pede limit itens (?limit=; PAGE_SIZE na listagem, SCAN_PAGE_SIZE nas leituras
+    completas). Com cursor, pede a página por keyset (?cursor=, mantendo ?page=
+    para APIs que não o suportam). total_pages vem da resposta quando a API o
+    informa; senão é calculado do total e do limite efetivo. Se a resposta trouxer
+    "next_cursor", ele fica no meta e, nas páginas da listagem, é lembrado para a seguinte.
     """
     if not api_base_url:
         # Mock para dev/local sem API
@@ -646,52 +1676,37 @@ def fetch_patients(api_base_url: str, nome: str, page: int = 1) -> Tuple[List[Di
         params.append(f"nome={quote(nome)}")
     if page > 1:
         params.append(f"page={page}")
+    params.append(f"limit={limit}")
+    if cursor:
+        params.append(f"cursor={quote(cursor)}")
+    if updated_since:
+        params.append(f"updated_since={quote(updated_since)}")
     
-    if params:
-        url = f"{api_base_url}/pacientes?{'&'.join(params)}"
-    else:
-        url = f"{api_base_url}/pacientes"
+    url = f"{api_base_url}/pacientes?{'&'.join(params)}"
 
     try:
-        session = get_http_session()
-        resp = session.get(url, timeout=12)
+        resp = api_get(url)
         resp.raise_for_status()
         data = resp.json()
 
         items = data.get("items", [])
-        normalized = []
-        for item in items:
-            # Combina cidade e estado se existirem separadamente
-            cidade = item.get("cidade", "")
-            estado = item.get("estado", "")
-            cidade_estado = ""
-            if cidade and estado:
-                cidade_estado = f"{cidade}/{estado}"
-            elif cidade:
-                cidade_estado = cidade
-            elif estado:
-                cidade_estado = estado
-            else:
-                cidade_estado = item.get("cidade_estado", "")  # Fallback para formato antigo
-            
-            normalized.append({
-                "id": item.get("id"),
-                "nome": item.get("nome") or "",
-                "nascimento": item.get("nascimento") or "",
-                "celular": item.get("celular") or item.get("telefone", "") or "",  # Fallback para compatibilidade
-                "telefone_residencial": item.get("telefone_residencial") or "",
-                "email": item.get("email") or "",
-                "profissao": item.get("profissao") or "",
-                "cpf": item.get("cpf") or "",
-                "endereco": item.get("endereco") or "",
-                "cidade_estado": cidade_estado,
-                "cep": item.get("cep") or "",
-                "observacao": item.get("observacao") or "",
-                "como_conheceu": item.get("como_conheceu") or "",
-            })
+        with profile_phase("normalize"):
+            normalized = normalize_patients(items)
         
         total = data.get("total", len(normalized))
-        total_pages = max(1, (total + 24) // 25)  # Calcula total de páginas (25 por página)
+        next_cursor = data.get("next_cursor") or ""
+        if data.get("total_pages"):
+            total_pages = int(data["total_pages"])
+        elif "total" in data:
+            limite = int(data.get("limit") or data.get("page_size") or 0)
+            if not limite:
+                # A API não informa o tamanho da página: uma primeira página mais curta que
+                # o pedido, com mais pacientes no total, revela que ela ignora ?limit=
+                limite = len(normalized) if page == 1 and 0 < len(normalized) < min(limit, total) else limit
+            total_pages = max(1, (total + limite - 1) // limite)
+        else:
+            # API só com cursor: sabe-se apenas se há uma próxima página
+            total_pages = page + 1 if next_cursor else page
         
         meta = {
             "query": data.get("query", nome),
@@ -700,83 +1715,657 @@ def fetch_patients(api_base_url: str, nome: str, page: int = 1) -> Tuple[List[Di
             "page": page,
             "total_pages": total_pages,
         }
+        if next_cursor:
+            meta["next_cursor"] = next_cursor
+            # Os cursores lembrados são das páginas da listagem (numeradas em PAGE_SIZE)
+            if not updated_since and limit == PAGE_SIZE:
+                remember_page_cursor(api_base_url, nome, page + 1, next_cursor)
+        # Horário do servidor: cursor inicial da sincronização incremental do índice
+        server_time = data.get("server_time") or _http_date_iso(resp.headers.get("Date", ""))
+        if server_time:
+            meta["server_time"] = server_time
+        # Presentes apenas em respostas incrementais (?updated_since=)
+        if "cursor" in data:
+            meta["cursor"] = data.get("cursor") or ""
+            meta["deleted"] = data.get("deleted") or []
         return normalized, meta
 
-    except requests.HTTPError:
+    except requests.HTTPError as exc:
         # Erro HTTP - não exibe erro na interface
-        pass
-    except requests.RequestException:
+        record_fetch_error("load_patients_page", exc)
+    except requests.RequestException as exc:
         # Erro de rede - não exibe erro na interface
-        pass
-    except ValueError:
+        record_fetch_error("load_patients_page", exc)
+    except ValueError as exc:
         # Erro de JSON - não exibe erro na interface
-        pass
+        record_fetch_error("load_patients_page", exc)
 
-    return [], {"query": nome, "total": 0, "version": "", "page": page, "total_pages": 1}
+    return [], {"query": nome, "total": 0, "version": "", "page": page, "total_pages": 1, "error": True}
 
-@st.cache_data(show_spinner=False)
-def create_excel_download(pacientes: List[Dict[str, Any]]) -> bytes:
-    """Cria um arquivo Excel com todos os pacientes para download."""
-    if not pacientes:
-        return b""
-    
-    # Cria DataFrame com os dados dos pacientes
-    df = pd.DataFrame(pacientes)
-    
-    # Garante que todos os campos necessários existam
-    required_columns = ['nome', 'nascimento', 'celular', 'telefone_residencial', 'email', 'profissao', 'cpf', 'endereco', 'cidade_estado', 'cep', 'observacao', 'como_conheceu', 'id']
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = ""
-    
-    # Reorganiza as colunas para uma ordem mais lógica
-    columns_order = ['nome', 'nascimento', 'celular', 'telefone_residencial', 'email', 'profissao', 'cpf', 'endereco', 'cidade_estado', 'cep', 'observacao', 'como_conheceu', 'id']
-    df = df[columns_order]
-    
-    # Renomeia as colunas para português
-    df.columns = ['Nome', 'Nascimento', 'Celular', 'Telefone Residencial', 'E-mail', 'Profissão', 'CPF', 'Endereço', 'Cidade/Estado', 'CEP', 'Observação', 'Como conheceu', 'ID']
-    
-    # Cria o arquivo Excel em memória
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Pacientes', index=False)
-        
-        # Ajusta a largura das colunas automaticamente
-        worksheet = writer.sheets['Pacientes']
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)  # Máximo de 50 caracteres
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-    
-    output.seek(0)
-    return output.getvalue()
+def _http_date_iso(valor: str) -> str:
+    """Header HTTP Date (RFC 7231) em ISO 8601 UTC, ou "" se ausente/inválido."""
+    try:
+        return parsedate_to_datetime(valor).astimezone(timezone.utc).isoformat()
+    except (TypeError, ValueError, IndexError):
+        return ""
+
+class ExportIncompleteError(Exception):
+    """Uma leitura completa de /pacientes falhou no meio ou veio curta: o resultado ficaria truncado."""
+
+def iter_patient_pages(api_base_url: str, nome: str) -> Iterator[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Percorre todas as páginas de /pacientes (SCAN_PAGE_SIZE por requisição), uma
+    por vez, sem repetir pacientes. Não depende de total_pages (uma API de páginas
+    fixas ignora ?limit=): segue até alcançar "total" e não haver next_cursor, ou
+    até uma página sem pacientes novos. Levanta ExportIncompleteError se alguma
+    página falhar (após os retries) ou se vierem menos pacientes que o total.
+    """
+    page, cursor = 1, ""
+    vistos = set()
+    while True:
+        pacientes, meta = load_patients_page(api_base_url, nome, page, cursor=cursor, limit=SCAN_PAGE_SIZE)
+        if meta.get("error"):
+            raise ExportIncompleteError(f"falha ao buscar a página {page} de /pacientes")
+        novos = [p for p in pacientes if str(p.get("id")) not in vistos]
+        vistos.update(str(p.get("id")) for p in novos)
+        yield novos, meta
+        cursor = meta.get("next_cursor", "")
+        if not novos or (len(vistos) >= int(meta.get("total") or 0) and not cursor):
+            break
+        page += 1
+    if len(vistos) < int(meta.get("total") or 0):
+        raise ExportIncompleteError(f"{len(vistos)} de {meta['total']} pacientes lidos de /pacientes")
+
+def iter_all_patients(api_base_url: str, nome: str) -> Iterator[Dict[str, Any]]:
+    """Todos os pacientes da busca atual, página a página (ver iter_patient_pages)."""
+    for pacientes, _ in iter_patient_pages(api_base_url, nome):
+        yield from pacientes
+
+# Colunas exportadas (campo normalizado, cabeçalho em português), na ordem da planilha
+EXPORT_COLUMNS = [
+    ("nome", "Nome"),
+    ("nascimento", "Nascimento"),
+    ("celular", "Celular"),
+    ("telefone_residencial", "Telefone Residencial"),
+    ("email", "E-mail"),
+    ("profissao", "Profissão"),
+    ("cpf", "CPF"),
+    ("endereco", "Endereço"),
+    ("cidade_estado", "Cidade/Estado"),
+    ("cep", "CEP"),
+    ("observacao", "Observação"),
+    ("como_conheceu", "Como conheceu"),
+    ("id", "ID"),
+]
+
+def create_excel_download(pacientes: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Cria o arquivo Excel com os pacientes em modo streaming, sem materializar a lista.
+    O openpyxl write-only exige as larguras antes da primeira linha, então os
+    registros passam primeiro por um arquivo temporário em disco enquanto se calcula
+    o máximo de cada coluna; depois são gravados na planilha. Só o arquivo final
+    (já compactado) é lido para memória, pois é o que st.download_button recebe.
+    """
+    campos = [campo for campo, _ in EXPORT_COLUMNS]
+    larguras = [len(cabecalho) for _, cabecalho in EXPORT_COLUMNS]
+
+    with tempfile.TemporaryFile() as spool, tempfile.TemporaryFile() as output:
+        linhas = 0
+        for paciente in pacientes:
+            linha = ["" if paciente.get(campo) is None else paciente.get(campo) for campo in campos]
+            for i, valor in enumerate(linha):
+                tamanho = len(str(valor))
+                if tamanho > larguras[i]:
+                    larguras[i] = tamanho
+            pickle.dump(linha, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            linhas += 1
+        spool.seek(0)
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet("Pacientes")
+        for i, largura in enumerate(larguras, start=1):
+            # Máximo de 50 caracteres
+            worksheet.column_dimensions[get_column_letter(i)].width = min(largura + 2, 50)
+        worksheet.append([cabecalho for _, cabecalho in EXPORT_COLUMNS])
+        for _ in range(linhas):
+            worksheet.append(pickle.load(spool))
+        workbook.save(output)
+
+        output.seek(0)
+        return output.read()
+
+def iter_csv_chunks(pacientes: Iterable[Dict[str, Any]], rows_per_chunk: int = 2000) -> Iterator[bytes]:
+    """Gera o CSV (UTF-8 com BOM, legível no Excel) em blocos de bytes, sem materializar a lista."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([cabecalho for _, cabecalho in EXPORT_COLUMNS])
+    yield "\ufeff".encode("utf-8") + buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+
+    linhas = 0
+    for paciente in pacientes:
+        writer.writerow(["" if paciente.get(campo) is None else paciente.get(campo) for campo, _ in EXPORT_COLUMNS])
+        linhas += 1
+        if linhas % rows_per_chunk == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def create_csv_download(pacientes: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Cria o CSV de pacientes a partir de iter_csv_chunks. Esta versão do Streamlit
+    não aceita geradores em st.download_button, então os blocos passam por um
+    arquivo temporário e só o resultado final é lido para memória.
+    """
+    with tempfile.TemporaryFile() as output:
+        for chunk in iter_csv_chunks(pacientes):
+            output.write(chunk)
+        output.seek(0)
+        return output.read()
+
+def create_parquet_download(pacientes: Iterable[Dict[str, Any]], batch_size: int = 5000) -> bytes:
+    """
+    Cria um arquivo Parquet (colunar, compactado) de pacientes. Os registros são
+    agrupados em lotes de batch_size, convertidos com pandas e gravados como row
+    groups, de modo que a memória não cresce com o total exportado.
+    """
+    campos = [campo for campo, _ in EXPORT_COLUMNS]
+    # Todas as colunas como texto: mantém o schema estável entre lotes (ex.: id numérico ou string)
+    schema = pa.schema([(campo, pa.string()) for campo in campos])
+
+    def _flush(lote: List[Dict[str, Any]]) -> None:
+        df = pd.DataFrame.from_records(lote, columns=campos).fillna("").astype(str)
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+
+    with tempfile.TemporaryFile() as output:
+        with pq.ParquetWriter(output, schema, compression="snappy") as writer:
+            lote = []
+            for paciente in pacientes:
+                lote.append(paciente)
+                if len(lote) >= batch_size:
+                    _flush(lote)
+                    lote = []
+            if lote:
+                _flush(lote)
+        output.seek(0)
+        return output.read()
+
+# Formatos de exportação: rótulo -> (função geradora, extensão, mime)
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": (create_excel_download, "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (.csv)": (create_csv_download, "csv", "text/csv"),
+    "Parquet (.parquet)": (create_parquet_download, "parquet", "application/vnd.apache.parquet"),
+}
+
+# ---------------------------
+# Índice local de pacientes (busca instantânea)
+# ---------------------------
+INDEX_FIELDS = ("id", "nome", "celular", "telefone", "email")
+
+@st.cache_resource(show_spinner=False)
+def get_patient_index() -> Dict[str, Any]:
+    """
+    Índice em memória, compartilhado entre sessões, com id/nome/telefone/e-mail.
+    "tokens" é uma lista ordenada de (token_normalizado, id): a busca por prefixo
+    é um intervalo via bisect, sem estruturas por prefixo que pesariam na memória.
+    """
+    return {
+        "lock": threading.RLock(),
+        "records": {},
+        "record_tokens": {},
+        "tokens": [],
+        "ready": False,
+        "loaded_at": 0.0,
+        "synced_at": 0.0,
+        "version": "",
+        "cursor": "",
+    }
+
+def index_tokens(paciente: Dict[str, Any]) -> List[str]:
+    """Tokens normalizados (sem acento, minúsculos) de nome, e-mail e dígitos dos telefones."""
+    tokens = normalize(paciente.get("nome", "")).split()
+    email = normalize(paciente.get("email", ""))
+    if email:
+        tokens.append(email)
+        tokens.extend(t for t in re.split(r"[@._+-]+", email) if t)
+    for campo in ("celular", "telefone"):
+        digitos = re.sub(r"\D", "", str(paciente.get(campo) or ""))
+        if digitos:
+            tokens.append(digitos)
+            if len(digitos) >= 10:
+                tokens.append(digitos[2:])  # sem DDD
+    return list(dict.fromkeys(tokens))
+
+def _index_record(paciente: Dict[str, Any]) -> Dict[str, Any]:
+    registro = {campo: paciente.get(campo) or "" for campo in INDEX_FIELDS}
+    registro["id"] = paciente.get("id")
+    registro["_nome_norm"] = normalize(registro["nome"])
+    return registro
+
+def _index_remove(index: Dict[str, Any], pid: str) -> None:
+    for token in index["record_tokens"].pop(pid, []):
+        pos = bisect.bisect_left(index["tokens"], (token, pid))
+        if pos < len(index["tokens"]) and index["tokens"][pos] == (token, pid):
+            del index["tokens"][pos]
+    index["records"].pop(pid, None)
+
+def index_upsert(index: Dict[str, Any], paciente: Dict[str, Any]) -> None:
+    """Insere/atualiza um paciente no índice (chamar com index["lock"])."""
+    pid = str(paciente.get("id"))
+    _index_remove(index, pid)
+    registro = _index_record(paciente)
+    tokens = index_tokens(registro)
+    index["records"][pid] = registro
+    index["record_tokens"][pid] = tokens
+    for token in tokens:
+        bisect.insort(index["tokens"], (token, pid))
+
+def load_patient_index(api_base_url: str) -> None:
+    """
+    Carrega todos os pacientes da API e troca o índice de uma vez (leitores nunca
+    veem meio índice). O cursor da sincronização incremental é o horário do
+    servidor na primeira página (anterior a tudo o que a carga leu), não o relógio
+    local, que pode estar adiantado e perder alterações.
+    """
+    inicio = ""
+    records, record_tokens, tokens = {}, {}, []
+    version = ""
+    try:
+        for pacientes, meta in iter_patient_pages(api_base_url, ""):
+            if meta["page"] == 1:
+                if not pacientes and not meta.get("version"):
+                    return  # API indisponível: mantém o índice atual
+                inicio = meta.get("server_time", "")
+            version = meta.get("version", version)
+            for paciente in pacientes:
+                pid = str(paciente.get("id"))
+                registro = _index_record(paciente)
+                records[pid] = registro
+                record_tokens[pid] = index_tokens(registro)
+                tokens.extend((token, pid) for token in record_tokens[pid])
+    except ExportIncompleteError:
+        return  # página com falha ou leitura curta: mantém o índice atual (nunca troca por um parcial)
+    tokens.sort()
+
+    index = get_patient_index()
+    with index["lock"]:
+        index.update(records=records, record_tokens=record_tokens, tokens=tokens, ready=True,
+                     loaded_at=time.time(), synced_at=time.time(), version=version, cursor=inicio)
+
+def sync_patient_index(api_base_url: str) -> None:
+    """
+    Sincronização incremental: GET {API_URL}/pacientes?updated_since=<cursor>.
+    Espera resposta (paginada como /pacientes):
+    {
+      "items": [...pacientes criados/alterados...],
+      "deleted": [ids removidos],
+      "cursor": "<cursor para a próxima sincronização>",
+      "version": "..."
+    }
+    O cursor inicial é o horário do servidor (UTC, ISO 8601) em que a carga
+    completa começou; sem ele, vale só a verificação de "version".
+    Aplica os deltas no índice e invalida só as entradas de cache dos pacientes
+    afetados. Se a API ignorar o parâmetro (resposta sem "cursor"), recarrega tudo
+    quando "version" mudar ou a cada LOCAL_INDEX_REFRESH segundos.
+    """
+    index = get_patient_index()
+    if not index["ready"]:
+        load_patient_index(api_base_url)
+        return
+
+    alterados, removidos = [], []
+    cursor = index["cursor"]
+    page = total_pages = 1
+    while True:
+        pacientes, meta = load_patients_page(api_base_url, "", page, updated_since=index["cursor"], limit=SCAN_PAGE_SIZE)
+        if "cursor" not in meta or not index["cursor"]:
+            index["synced_at"] = time.time()
+            versao_mudou = meta.get("version") and meta.get("version") != index["version"]
+            if versao_mudou or time.time() - index["loaded_at"] > LOCAL_INDEX_REFRESH:
+                load_patient_index(api_base_url)
+            return
+        alterados.extend(pacientes)
+        removidos.extend(str(pid) for pid in meta.get("deleted", []))
+        cursor = meta.get("cursor") or cursor
+        if page == 1:
+            # Só a primeira página revela o tamanho real das páginas (ver load_patients_page)
+            total_pages = int(meta.get("total_pages", 1))
+        if not pacientes or page >= total_pages:
+            break
+        page += 1
+
+    with index["lock"]:
+        for paciente in alterados:
+            index_upsert(index, paciente)
+        for pid in removidos:
+            _index_remove(index, pid)
+        index.update(synced_at=time.time(), cursor=cursor)
+
+    afetados = {str(p.get("id")) for p in alterados} | set(removidos)
+    for pid in afetados:
+        invalidate_patient_cache(api_base_url, pid)
+    remember_patients(alterados)
+
+def invalidate_patient_cache(api_base_url: str, pid: str) -> None:
+    """Remove dos caches apenas o registro e as entradas de detalhe/prontuários de um paciente."""
+    variantes = [pid]
+    if pid.lstrip("-").isdigit():
+        variantes.append(int(pid))  # a UI chama com o id convertido para int quando possível
+    forget_patient(pid)
+    cache = get_response_cache()
+    for variante in variantes:
+        fetch_patient_by_id.clear(api_base_url, variante)
+        fetch_prontuarios.clear(api_base_url, variante)
+        cache.delete(response_cache_key("fetch_patient_by_id", (api_base_url, variante)))
+        cache.delete(response_cache_key("fetch_prontuarios", (api_base_url, variante)))
+
+def ensure_patient_index(api_base_url: str) -> bool:
+    """Agenda a carga ou a sincronização do índice em segundo plano. Retorna se já está pronto."""
+    index = get_patient_index()
+    if not index["ready"] or time.time() - index["synced_at"] > LOCAL_INDEX_SYNC:
+        submit_background(sync_patient_index, api_base_url)
+    return index["ready"]
+
+def search_patients_local(nome: str, page: int = 1) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Busca no índice local: cada termo digitado precisa ser prefixo de algum token
+    do paciente. Retorna (lista_de_pacientes, meta) no mesmo formato de fetch_patients.
+    """
+    index = get_patient_index()
+    termos = normalize(nome).split()
+    with index["lock"]:
+        if termos:
+            ids = None
+            for termo in termos:
+                inicio = bisect.bisect_left(index["tokens"], (termo, ""))
+                fim = bisect.bisect_left(index["tokens"], (termo + "\uffff", ""))
+                encontrados = {pid for _, pid in index["tokens"][inicio:fim]}
+                ids = encontrados if ids is None else ids & encontrados
+                if not ids:
+                    break
+            registros = [index["records"][pid] for pid in ids or ()]
+        else:
+            registros = list(index["records"].values())
+        registros.sort(key=lambda r: r["_nome_norm"])
+        version = index["version"]
+
+    total = len(registros)
+    total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+    inicio = (page - 1) * PAGE_SIZE
+    items = [
+        {campo: valor for campo, valor in registro.items() if not campo.startswith("_")}
+        for registro in registros[inicio:inicio + PAGE_SIZE]
+    ]
+    return items, {"query": nome, "total": total, "version": version, "page": page, "total_pages": total_pages, "source": "local"}
+
+def pdf_arquivo(classe: str) -> str:
+    """Caminho do arquivo no storage a partir da classe do prontuário."""
+    # Remove protocolo indesejado caso a classe venha no formato "@http://...pdf"
+    return f"pdfs/{classe.replace('http://', '')}"
+
+@st.cache_resource(show_spinner=False)
+def get_pdf_batch_state() -> Dict[str, Any]:
+    """Lembra se a API suporta o endpoint em lote, para não sondá-lo a cada detalhe."""
+    return {"supported": True, "checked_at": 0.0}
+
+@st.cache_data(show_spinner=False, ttl=PDF_URL_TTL)
+def get_pdf_download_urls(api_base_url: str, classes: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    Variante em lote de get_pdf_download_url: POST {API_URL}/pdfs/download/batch
+    com {"arquivos": ["pdfs/<classe>", ...]}. Espera resposta:
+    {
+      "items": [{"arquivo": "pdfs/<classe>", "download_info": {"url": "..."}}, ...]
+    }
+    Retorna {classe: url} apenas para as classes resolvidas; se a API não
+    suportar o lote (404/405/501), retorna {} e o chamador cai para as
+    consultas individuais.
+    """
+    if not api_base_url or not classes:
+        return {}
+    state = get_pdf_batch_state()
+    if not state["supported"] and time.time() - state["checked_at"] < PDF_BATCH_RETRY_AFTER:
+        return {}
+
+    por_arquivo = {pdf_arquivo(classe): classe for classe in classes}
+    try:
+        resp = api_request(
+            "POST",
+            f"{api_base_url}/pdfs/download/batch",
+            json={"arquivos": list(por_arquivo)},
+        )
+        if resp.status_code in (404, 405, 501):
+            state["supported"] = False
+            state["checked_at"] = time.time()
+            return {}
+        resp.raise_for_status()
+        data = resp.json()
+    except requests.RequestException as exc:
+        record_fetch_error("get_pdf_download_urls", exc)
+        return {}
+    except ValueError as exc:
+        record_fetch_error("get_pdf_download_urls", exc)
+        return {}
 
-@st.cache_data(show_spinner=False, ttl=600)
+    state["supported"] = True
+    urls = {}
+    items = data.get("items", []) if isinstance(data, dict) else []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        classe = por_arquivo.get(item.get("arquivo", ""))
+        url_pdf = (item.get("download_info") or {}).get("url", "")
+        if classe and url_pdf:
+            urls[classe] = url_pdf
+    return urls
+
+@st.cache_data(show_spinner=False, ttl=PDF_URL_TTL)
 def get_pdf_download_url(api_base_url: str, classe: str) -> str:
     """Obtém e cacheia a URL de download do PDF para uma classe específica."""
     if not api_base_url or not classe:
         return ""
     try:
-        session = get_http_session()
-        # Remove protocolo indesejado caso a classe venha no formato "@http://...pdf"
-        clean_classe = classe.replace("http://", "")
-        pdf_url = f"{api_base_url}/pdfs/download?arquivo=pdfs/{clean_classe}"
-        pdf_resp = session.get(pdf_url, timeout=12)
+        pdf_url = f"{api_base_url}/pdfs/download?arquivo={pdf_arquivo(classe)}"
+        pdf_resp = api_get(pdf_url)
         if pdf_resp.status_code == 200:
             pdf_data = pdf_resp.json()
             return pdf_data.get("download_info", {}).get("url", "")
-    except Exception:
+    except Exception as exc:
+        record_fetch_error("get_pdf_download_url", exc)
         return ""
     return ""
 
-@st.cache_data(show_spinner=False, ttl=180)
+def resolve_pdf_urls(api_base_url: str, prontuarios: List[Dict[str, Any]], deadline: float = PDF_URL_DEADLINE) -> None:
+    """
+    Preenche "pdf_url" dos prontuários em PDF. Tenta primeiro uma única chamada
+    em lote (get_pdf_download_urls); o que faltar é consultado em /pdfs/download
+    em paralelo, num pool limitado de threads (mesma sessão HTTP) ou, com
+    HTTP_CLIENT=async, juntas no event loop do httpx. O prazo vale para o total,
+    lote incluído: o que não responder a tempo fica sem link nesta renderização,
+    mas segue em segundo plano e fica em cache para a próxima.
+    """
+    if not api_base_url or not prontuarios:
+        return
+    classes = list(dict.fromkeys(
+        p.get("classe") for p in prontuarios if p.get("tipo_doc") == "pdf" and p.get("classe")
+    ))
+    if not classes:
+        return
+
+    # O lote também corre no pool de PDFs, sob o mesmo prazo: um POST lento não segura o detalhe
+    ctx = get_script_run_ctx()
+
+    def _lote():
+        attach_background_ctx(ctx)
+        return get_pdf_download_urls(api_base_url, tuple(classes))
+
+    inicio = time.monotonic()
+    futuro = get_pdf_executor().submit(_lote)
+    if not wait([futuro], timeout=deadline).done:
+        return  # segue no pool e fica no cache de get_pdf_download_urls para a próxima renderização
+    try:
+        urls = dict(futuro.result())
+    except Exception as exc:
+        record_fetch_error("get_pdf_download_urls", exc)
+        urls = {}
+    pendentes = [classe for classe in classes if classe not in urls]
+    if pendentes:
+        restante = max(0.0, deadline - (time.monotonic() - inicio))
+        urls.update(_resolve_pdf_urls_individually(api_base_url, pendentes, restante))
+
+    for prontuario in prontuarios:
+        url_pdf = urls.get(prontuario.get("classe"))
+        if prontuario.get("tipo_doc") == "pdf" and url_pdf:
+            prontuario["pdf_url"] = url_pdf
+
+@st.cache_resource(show_spinner=False)
+def get_pdf_executor() -> ThreadPoolExecutor:
+    """Pool das consultas a /pdfs/download, compartilhado entre sessões (PDF_URL_WORKERS no total)."""
+    return ThreadPoolExecutor(max_workers=max(1, PDF_URL_WORKERS), thread_name_prefix="pdf-url")
+
+def _resolve_pdf_urls_individually(api_base_url: str, classes: List[str], deadline: float) -> Dict[str, str]:
+    """Fallback por arquivo: uma chamada a get_pdf_download_url por classe, em paralelo e com prazo."""
+    ctx = get_script_run_ctx()
+
+    def _consultar(classe):
+        # As threads do pool são compartilhadas: o contexto da sessão vai em cada tarefa
+        attach_background_ctx(ctx)
+        return get_pdf_download_url(api_base_url, classe)
+
+    if HTTP_CLIENT == "async" and httpx is not None:
+        return _resolve_pdf_urls_async(api_base_url, classes, deadline)
+
+    executor = get_pdf_executor()
+    futures = {executor.submit(_consultar, classe): classe for classe in classes}
+    # Não espera as pendentes: continuam no pool e populam o cache ao terminar
+    done, _ = wait(futures, timeout=deadline)
+
+    urls = {}
+    for future in done:
+        try:
+            url_pdf = future.result()
+        except Exception:
+            continue
+        if url_pdf:
+            urls[futures[future]] = url_pdf
+    return urls
+
+@st.cache_resource(show_spinner=False)
+def get_async_pdf_urls() -> Dict[str, Any]:
+    """URLs de PDF resolvidas pelo caminho assíncrono: {(api, classe): (instante, url)}, compartilhado entre sessões."""
+    return {"lock": threading.Lock(), "urls": {}}
+
+def _resolve_pdf_urls_async(api_base_url: str, classes: List[str], deadline: float) -> Dict[str, str]:
+    """
+    Fallback por arquivo com HTTP_CLIENT=async: as consultas vão juntas, por
+    asyncio.gather, no event loop do cliente httpx (multiplexadas numa conexão
+    HTTP/2 quando há h2), em vez de uma thread bloqueada por PDF. As URLs ficam
+    em get_async_pdf_urls pelo mesmo ttl de get_pdf_download_url; o que passar do
+    prazo segue no loop e fica pronto para a próxima renderização.
+    """
+    memo = get_async_pdf_urls()
+    agora = time.monotonic()
+    with memo["lock"]:
+        for chave in [k for k, (instante, _) in memo["urls"].items() if agora - instante >= PDF_URL_TTL]:
+            del memo["urls"][chave]
+        urls = {c: memo["urls"][(api_base_url, c)][1] for c in classes if (api_base_url, c) in memo["urls"]}
+    pendentes = [classe for classe in classes if classe not in urls]
+    if not pendentes:
+        return urls
+
+    async_client = get_async_http_client()
+    futuro = asyncio.run_coroutine_threadsafe(
+        _fetch_pdf_urls_async(async_client["client"], api_base_url, pendentes, memo, get_circuit_breaker(), get_metrics()),
+        async_client["loop"],
+    )
+    try:
+        futuro.result(timeout=deadline)
+    except TimeoutError:
+        pass  # não cancela: as consultas restantes terminam no loop e entram no memo
+    except Exception as exc:
+        record_fetch_error("get_pdf_download_url", exc)
+
+    with memo["lock"]:
+        for classe in pendentes:
+            resolvida = memo["urls"].get((api_base_url, classe))
+            if resolvida:
+                urls[classe] = resolvida[1]
+    return urls
+
+async def _fetch_pdf_urls_async(client: Any, api_base_url: str, classes: List[str], memo: Dict[str, Any], breaker: CircuitBreaker, metrics: Metrics) -> None:
+    """
+    Consulta /pdfs/download para cada classe no event loop, até PDF_URL_WORKERS
+    de cada vez. Uma tentativa por arquivo, sob o circuito da API e com as mesmas
+    métricas de api_request; sem retries (o PDF que falhar é pedido de novo na
+    próxima renderização). Roda na thread do loop: recebe breaker e métricas prontos.
+    """
+    url = f"{api_base_url}/pdfs/download"
+    rotulos = {"endpoint": metric_endpoint(url), "method": "GET"}
+    limite = asyncio.Semaphore(max(1, PDF_URL_WORKERS))
+
+    def _erro(exc: Exception) -> None:
+        metrics.inc("app_fetch_errors_total", {"function": "get_pdf_download_url", "error": type(exc).__name__})
+
+    async def _consultar(classe: str) -> None:
+        async with limite:
+            if not breaker.allow():
+                metrics.inc("app_http_requests_total", {**rotulos, "status": "CircuitOpenError"})
+                return
+            concluido = False
+            try:
+                inicio = time.perf_counter()
+                try:
+                    resp = await client.get(url, params={"arquivo": pdf_arquivo(classe)}, timeout=HTTP_TIMEOUT)
+                except httpx.HTTPError as exc:
+                    metrics.observe("app_http_request_duration_seconds", rotulos, time.perf_counter() - inicio, LATENCY_BUCKETS)
+                    metrics.inc("app_http_requests_total", {**rotulos, "status": type(exc).__name__})
+                    breaker.record_failure()
+                    concluido = True
+                    _erro(exc)
+                    return
+                metrics.observe("app_http_request_duration_seconds", rotulos, time.perf_counter() - inicio, LATENCY_BUCKETS)
+                metrics.inc("app_http_requests_total", {**rotulos, "status": resp.status_code})
+                metrics.observe("app_http_response_bytes", rotulos, len(resp.content), SIZE_BUCKETS)
+                if (resp.status_code < 500 and resp.status_code != 429) or resp.status_code == 501:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure(_retry_after(resp))
+                concluido = True
+            finally:
+                if not concluido:
+                    breaker.release()
+
+        if resp.status_code != 200:
+            return
+        try:
+            url_pdf = resp.json().get("download_info", {}).get("url", "")
+        except (ValueError, AttributeError) as exc:
+            _erro(exc)
+            return
+        if url_pdf:
+            with memo["lock"]:
+                memo["urls"][(api_base_url, classe)] = (time.monotonic(), url_pdf)
+
+    await asyncio.gather(*(_consultar(classe) for classe in classes), return_exceptions=True)
+
+def resolve_requested_pdf(api_base_url: str, prontuarios: List[Dict[str, Any]], classe: str) -> str:
+    """Modo lazy: resolve apenas o PDF clicado (?pdf=<classe>) e o associa ao prontuário correspondente."""
+    if not api_base_url or not classe:
+        return ""
+    alvos = [p for p in prontuarios if p.get("tipo_doc") == "pdf" and p.get("classe") == classe]
+    if not alvos:
+        return ""
+    url_pdf = get_pdf_download_url(api_base_url, classe)
+    if url_pdf:
+        for prontuario in alvos:
+            prontuario["pdf_url"] = url_pdf
+    return url_pdf
+
+@single_flight
+@st.cache_data(show_spinner=False, ttl=API_CACHE_TTL)
+@response_cache(lambda resultado: bool(resultado[0] or resultado[1]))
 def fetch_prontuarios(api_base_url: str, paciente_id: Any) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
     Busca prontuários na API: GET {API_URL}/pacientes/prontuarios?id=<id>
@@ -805,8 +2394,7 @@ def fetch_prontuarios(api_base_url: str, paciente_id: Any) -> Tuple[List[Dict[st
     
     url = f"{api_base_url}/pacientes/prontuarios?id={quote(str(paciente_id))}"
     try:
-        session = get_http_session()
-        resp = session.get(url, timeout=12)
+        resp = api_get(url)
         resp.raise_for_status()
         data = resp.json()
         
@@ -814,31 +2402,25 @@ def fetch_prontuarios(api_base_url: str, paciente_id: Any) -> Tuple[List[Dict[st
             prontuarios = data.get("prontuarios", [])
             paciente_info = data.get("paciente", {})
             
-            # Processa cada prontuário para obter URLs dos PDFs
-            if prontuarios and api_base_url:
-                for prontuario in prontuarios:
-                    if prontuario.get("tipo_doc") == "pdf" and prontuario.get("classe"):
-                        url_pdf = get_pdf_download_url(api_base_url, prontuario.get("classe"))
-                        if url_pdf:
-                            prontuario["pdf_url"] = url_pdf
-            
             return prontuarios, paciente_info
         else:
             return [], {}
             
-    except requests.HTTPError:
+    except requests.HTTPError as exc:
         # Erro HTTP (como 404) - não exibe erro na interface
-        pass
-    except requests.RequestException:
+        record_fetch_error("fetch_prontuarios", exc)
+    except requests.RequestException as exc:
         # Erro de rede - não exibe erro na interface
-        pass
-    except ValueError:
+        record_fetch_error("fetch_prontuarios", exc)
+    except ValueError as exc:
         # Erro de JSON - não exibe erro na interface
-        pass
+        record_fetch_error("fetch_prontuarios", exc)
     
     return [], {}
 
-@st.cache_data(show_spinner=False, ttl=180)
+@single_flight
+@st.cache_data(show_spinner=False, ttl=API_CACHE_TTL)
+@response_cache(bool)
 def fetch_patient_by_id(api_base_url: str, paciente_id: Any) -> Dict[str, Any]:
     """Busca um paciente específico em {API_URL}/pacientes/<id> (se existir)."""
     if not paciente_id:
@@ -862,8 +2444,7 @@ def fetch_patient_by_id(api_base_url: str, paciente_id: Any) -> Dict[str, Any]:
     # Novo formato: busca via /pacientes?id=<id>, que retorna lista de itens
     url = f"{api_base_url}/pacientes?id={quote(str(paciente_id))}"
     try:
-        session = get_http_session()
-        resp = session.get(url, timeout=12)
+        resp = api_get(url)
         resp.raise_for_status()
         data = resp.json()
 
@@ -887,42 +2468,94 @@ def fetch_patient_by_id(api_base_url: str, paciente_id: Any) -> Dict[str, Any]:
         if not matched:
             return {}
 
-        # Normaliza cidade/estado e campos esperados
-        cidade = matched.get("cidade", "")
-        estado = matched.get("estado", "")
-        cidade_estado = ""
-        if cidade and estado:
-            cidade_estado = f"{cidade}/{estado}"
-        elif cidade:
-            cidade_estado = cidade
-        elif estado:
-            cidade_estado = estado
-        else:
-            cidade_estado = matched.get("cidade_estado", "")  # Fallback para formato antigo
-
-        return {
-            "id": matched.get("id"),
-            "nome": matched.get("nome", ""),
-            "nascimento": matched.get("nascimento", ""),
-            "celular": matched.get("celular", "") or matched.get("telefone", "") or "",  # Fallback para compatibilidade
-            "telefone_residencial": matched.get("telefone_residencial", ""),
-            "email": matched.get("email", ""),
-            "profissao": matched.get("profissao", ""),
-            "cpf": matched.get("cpf", ""),
-            "endereco": matched.get("endereco", ""),
-            "cidade_estado": cidade_estado,
-            "cep": matched.get("cep", ""),
-            "observacao": matched.get("observacao", ""),
-            "como_conheceu": matched.get("como_conheceu", ""),
-        }
-    except requests.HTTPError:
-        pass
-    except requests.RequestException:
-        pass
-    except ValueError:
-        pass
+        with profile_phase("normalize"):
+            return normalize_patient(matched)
+    except requests.HTTPError as exc:
+        record_fetch_error("fetch_patient_by_id", exc)
+    except requests.RequestException as exc:
+        record_fetch_error("fetch_patient_by_id", exc)
+    except ValueError as exc:
+        record_fetch_error("fetch_patient_by_id", exc)
     return {}
 
+@st.cache_resource(show_spinner=False)
+def get_patient_records() -> Dict[str, Any]:
+    """Cache de registros de paciente por id, compartilhado entre sessões e alimentado pelas listagens."""
+    return {"lock": threading.Lock(), "records": OrderedDict()}
+
+def remember_patients(pacientes: List[Dict[str, Any]]) -> None:
+    """Guarda os registros normalizados (da lista ou do detalhe) para abrir o detalhe sem nova requisição."""
+    store = get_patient_records()
+    with store["lock"]:
+        for paciente in pacientes:
+            if paciente and paciente.get("id") is not None:
+                pid = str(paciente.get("id"))
+                store["records"][pid] = dict(paciente)
+                store["records"].move_to_end(pid)
+        while len(store["records"]) > PATIENT_RECORDS_MAX:
+            store["records"].popitem(last=False)
+
+def get_known_patient(paciente_id: Any) -> Dict[str, Any]:
+    """Registro já conhecido do paciente (cópia), ou {} se ainda não passou por nenhuma resposta."""
+    store = get_patient_records()
+    with store["lock"]:
+        paciente = store["records"].get(str(paciente_id))
+        return dict(paciente) if paciente else {}
+
+def forget_patient(paciente_id: Any) -> None:
+    store = get_patient_records()
+    with store["lock"]:
+        store["records"].pop(str(paciente_id), None)
+
+def refresh_patient_record(api_base_url: str, paciente_id: Any) -> None:
+    """Atualiza em segundo plano o registro de um paciente a partir de fetch_patient_by_id."""
+    paciente = fetch_patient_by_id(api_base_url, paciente_id)
+    if paciente:
+        remember_patients([paciente])
+
+# Campos que indicam que /pacientes/prontuarios devolve o cadastro completo em "paciente"
+PATIENT_DETAIL_FIELDS = ("celular", "telefone", "email", "cpf", "nascimento", "endereco")
+
+@st.cache_resource(show_spinner=False)
+def get_detail_api_state() -> Dict[str, Any]:
+    """Lembra se o "paciente" de /pacientes/prontuarios já traz o cadastro completo (None = ainda não se sabe)."""
+    return {"merged": None}
+
+def fetch_patient_detail(api_base_url: str, paciente_id: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Dados do detalhe: (paciente, prontuarios, paciente_api). A latência é a maior
+    das chamadas, não a soma:
+    - paciente já conhecido (cache de registros) ou API que devolve o cadastro
+      completo junto dos prontuários: uma única chamada bloqueante;
+    - caso contrário, fetch_patient_by_id e fetch_prontuarios rodam em paralelo.
+    """
+    state = get_detail_api_state()
+    paciente = get_known_patient(paciente_id)
+    conhecido = bool(paciente)
+
+    if conhecido or state["merged"] or not api_base_url:
+        prontuarios, paciente_api = fetch_prontuarios(api_base_url, paciente_id)
+    else:
+        with ThreadPoolExecutor(max_workers=1, initializer=attach_background_ctx, initargs=(get_script_run_ctx(),)) as executor:
+            futuro = executor.submit(fetch_prontuarios, api_base_url, paciente_id)
+            paciente = fetch_patient_by_id(api_base_url, paciente_id)
+            prontuarios, paciente_api = futuro.result()
+
+    merged = any(campo in (paciente_api or {}) for campo in PATIENT_DETAIL_FIELDS)
+    if api_base_url and paciente_api:
+        state["merged"] = merged
+
+    if merged:
+        # Cadastro completo veio junto dos prontuários: dispensa /pacientes?id=
+        paciente = {**paciente, **{k: v for k, v in normalize_patient(paciente_api).items() if v}}
+    elif conhecido and api_base_url:
+        submit_background(refresh_patient_record, api_base_url, paciente_id)
+    elif not paciente:
+        paciente = fetch_patient_by_id(api_base_url, paciente_id)
+
+    remember_patients([paciente])
+    return paciente, prontuarios, paciente_api
+
 def get_selected_paciente_id() -> Any:
     """Obtém o parâmetro id da URL (compatível com APIs antiga e nova)."""
     selected_id = None
@@ -939,8 +2572,14 @@ def get_selected_paciente_id() -> Any:
 
 
 def handle_search_change():
-    """Callback para mudança no input de busca: sincroniza URL, limpa id e reinicia paginação."""
+    """
+    Callback para mudança no input de busca: sincroniza URL, limpa id e reinicia
+    paginação. Também chamado no corpo do script (busca vinda da URL); só age
+    quando o texto difere da última busca aplicada.
+    """
     new_query = (st.session_state.get("search_q", "") or "").strip()
+    if new_query == st.session_state.get("last_search_query"):
+        return
     # Atualiza/remover nome
     if new_query:
         st.query_params["nome"] = new_query
@@ -961,8 +2600,157 @@ def handle_search_change():
     st.query_params["page"] = 1
     st.session_state["last_search_query"] = new_query
 
-def render_patient_detail(paciente: Dict[str, Any], prontuarios: List[Dict[str, Any]], paciente_api: Dict[str, Any] = None):
-    """Renderiza detalhe do paciente com prontuários abaixo, ocupando a página."""
+# ---------------------------
+# Templates HTML (cards e detalhe)
+# ---------------------------
+# Marcação montada uma vez, preenchida com str.format. Os fragmentos gerados são
+# memorizados pelo conteúdo que os produziu (id + valores dos campos), então um
+# rerun que só muda outro estado da página reaproveita o HTML já pronto.
+CARD_TEMPLATE = """<div class="card">
+  <a class="overlay-link" href="./?id={id}" target="_self" rel="noopener" tabindex="-1" aria-hidden="true"></a>
+  <h3>{nome}</h3>
+  <div class="row"><span class="label">Telefone:</span> {tel}</div>
+  <div class="row"><span class="label">E-mail:</span> {email}</div>
+</div>"""
+
+DETAIL_CARD_TEMPLATE = """
+<div class="detail-card">
+  <h2 style="margin-top:0;">Dados do Paciente</h2>
+{linhas}
+</div>
+"""
+DETAIL_ROW_TEMPLATE = '  <div class="row"><span class="label">{label}:</span> <span class="value">{valor}</span></div>'
+DETAIL_EMPTY_ROW_TEMPLATE = '  <div class="row"><span class="label">{label}:</span> <span class="empty">-</span></div>'
+
+PRONTUARIO_CARD_TEMPLATE = """
+<div class="card">
+  <div class="row"><span class="label">Data:</span> {data}</div>
+  <div class="row"><span class="label">Histórico:</span> <div style="margin-top: 5px; line-height: 1.4;">{historico}</div></div>
+{documento}</div>"""
+PRONTUARIO_PDF_TEMPLATE = '<div class="row"><span class="label">Documento:</span> <a href="{href}" target="{target}"{rel}>📄 Visualizar PDF</a></div>'
+PRONTUARIO_SEM_PDF = '<div class="row"><span class="label">Documento:</span> <span class="empty">PDF não disponível</span></div>'
+
+# Campos do detalhe, na ordem exibida: rótulo -> campos do paciente (o primeiro preenchido)
+DETAIL_FIELDS = (
+    ("Nascimento", ("nascimento",)),
+    ("Celular", ("celular", "telefone")),
+    ("Telefone Residencial", ("telefone_residencial",)),
+    ("E-mail", ("email",)),
+    ("Profissão", ("profissao",)),
+    ("CPF", ("cpf",)),
+    ("Endereço", ("endereco",)),
+    ("Cidade/Estado", ("cidade_estado",)),
+    ("CEP", ("cep",)),
+    ("Observação", ("observacao",)),
+    ("Como conheceu", ("como_conheceu",)),
+)
+
+@st.cache_resource(show_spinner=False)
+def get_html_fragments() -> Dict[str, Any]:
+    """Fragmentos HTML já gerados, por (tipo, conteúdo), compartilhados entre sessões (LRU)."""
+    return {"lock": threading.Lock(), "fragments": OrderedDict()}
+
+def memo_fragment(chave: Tuple[Any, ...], gerar, store: Dict[str, Any] = None) -> str:
+    """
+    HTML de gerar(), memorizado pela chave (que inclui todos os valores usados na
+    marcação). Em laços, passe o store de get_html_fragments() já obtido.
+    """
+    store = store or get_html_fragments()
+    try:
+        with store["lock"]:
+            html = store["fragments"].get(chave)
+            if html is not None:
+                store["fragments"].move_to_end(chave)
+                return html
+    except TypeError:
+        return gerar()  # valor não hasheável na chave: gera sem memorizar
+    html = gerar()
+    with store["lock"]:
+        store["fragments"][chave] = html
+        while len(store["fragments"]) > HTML_FRAGMENTS_MAX:
+            store["fragments"].popitem(last=False)
+    return html
+
+def _format_birth_date(value: str) -> str:
+    try:
+        # Remove a hora se existir e formata apenas a data
+        if " " in value:
+            return datetime.strptime(value.split(" ")[0], "%Y-%m-%d").strftime("%d/%m/%Y")
+        if "T" in value:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%d/%m/%Y")
+    except ValueError:
+        pass  # Mantém o valor original se não conseguir formatar
+    return value
+
+def _format_record_date(value: str) -> str:
+    if "T" in value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%d/%m/%Y %H:%M")
+        except ValueError:
+            pass
+    return value
+
+@st.cache_resource(show_spinner=False)
+def get_date_formatters() -> Dict[str, Any]:
+    """Formatação de datas memorizada por valor (as mesmas datas reaparecem a cada rerun)."""
+    return {
+        "nascimento": functools.lru_cache(maxsize=8192)(_format_birth_date),
+        "prontuario": functools.lru_cache(maxsize=8192)(_format_record_date),
+    }
+
+def detail_card_html(nome: Any, valores: Tuple[Any, ...]) -> str:
+    """Card "Dados do Paciente": nome seguido dos valores na ordem de DETAIL_FIELDS."""
+    formatar = get_date_formatters()["nascimento"]
+    linhas = []
+    for label, valor in zip(("Nome",) + tuple(label for label, _ in DETAIL_FIELDS), (nome,) + valores):
+        if label == "Nascimento" and valor and isinstance(valor, str):
+            valor = formatar(valor)
+        template = DETAIL_ROW_TEMPLATE if valor else DETAIL_EMPTY_ROW_TEMPLATE
+        linhas.append(template.format(label=label, valor=valor))
+    return DETAIL_CARD_TEMPLATE.format(linhas="\n".join(linhas))
+
+def prontuarios_html(prontuarios: Tuple[Tuple[Any, ...], ...], pdf_link_base: str) -> str:
+    """Seção de prontuários, mais recentes primeiro; cada item é (data, historico, tipo_doc, classe, pdf_url)."""
+    formatar = get_date_formatters()["prontuario"]
+    html_parts = ['<div class="prontuarios-section">', '<div class="cards-grid">']
+    for data, historico, tipo_doc, classe, pdf_link in sorted(prontuarios, key=lambda x: x[0], reverse=True):
+        # Link para PDF se for um documento PDF; caso contrário, informa indisponibilidade
+        documento = ""
+        if tipo_doc == "pdf" and classe:
+            if pdf_link:
+                documento = PRONTUARIO_PDF_TEMPLATE.format(href=pdf_link, target="_blank", rel=' rel="noopener"')
+            elif pdf_link_base:
+                documento = PRONTUARIO_PDF_TEMPLATE.format(href=f"{pdf_link_base}&pdf={quote(classe)}", target="_self", rel="")
+            else:
+                documento = PRONTUARIO_SEM_PDF
+        html_parts.append(PRONTUARIO_CARD_TEMPLATE.format(data=formatar(data) if data and isinstance(data, str) else data, historico=historico, documento=documento))
+    html_parts.append("</div>")
+    html_parts.append("</div>")
+    return "\n".join(html_parts)
+
+def card_html(campos: Tuple[Any, ...]) -> str:
+    """Card da listagem a partir de (id, nome, telefone, email)."""
+    pid, nome, tel, email = campos
+    return CARD_TEMPLATE.format(id=pid, nome=nome, tel=tel, email=email)
+
+def cards_html(pacientes: List[Dict[str, Any]]) -> str:
+    """Grade de cards de uma página; a página inteira e cada card são memorizados pelo conteúdo."""
+    campos = tuple(
+        # celular com fallback para telefone, por compatibilidade
+        (p.get("id"), p.get("nome", ""), p.get("celular", "") or p.get("telefone", ""), p.get("email", ""))
+        for p in pacientes
+    )
+
+    store = get_html_fragments()
+
+    def gerar():
+        cards = [memo_fragment(("card",) + c, lambda c=c: card_html(c), store) for c in campos]
+        return "\n".join(['<div class="cards-grid">'] + cards + ["</div>"])
+
+    return memo_fragment(("cards", campos), gerar, store)
+
+def render_detail_back_button() -> None:
+    """Botão de volta para a listagem, acima do detalhe."""
     col1, col2 = st.columns([1, 1], gap="large")
     with col1:
         if st.button("⬅ Voltar para lista", help="Voltar para a listagem de pacientes"):
@@ -973,98 +2761,42 @@ def render_patient_detail(paciente: Dict[str, Any], prontuarios: List[Dict[str,
                 pass
             st.rerun()
 
+def render_patient_header(destino: Any, paciente: Dict[str, Any], paciente_api: Dict[str, Any] = None) -> None:
+    """
+    Card com os dados do paciente, desenhado em destino (um st.empty): sai antes
+    dos prontuários a partir do registro já conhecido e é redesenhado no mesmo
+    lugar se a API trouxer dados mais completos.
+    """
     # Usa dados da API se disponível, senão usa dados locais
     nome_paciente = paciente_api.get("nome") if paciente_api else paciente.get("nome", "")
-    
-    # Função auxiliar para renderizar campos com formatação condicional
-    def format_field(value, field_name):
-        if value:
-            # Formatação especial para data de nascimento
-            if field_name == "Nascimento" and isinstance(value, str):
-                try:
-                    # Remove a hora se existir e formata apenas a data
-                    if " " in value:
-                        date_part = value.split(" ")[0]
-                        dt = datetime.strptime(date_part, "%Y-%m-%d")
-                        value = dt.strftime("%d/%m/%Y")
-                    elif "T" in value:
-                        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
-                        value = dt.strftime("%d/%m/%Y")
-                except:
-                    pass  # Mantém o valor original se não conseguir formatar
-            
-            return f'<div class="row"><span class="label">{field_name}:</span> <span class="value">{value}</span></div>'
-        else:
-            return f'<div class="row"><span class="label">{field_name}:</span> <span class="empty">-</span></div>'
-    
-    # Renderiza os dados do paciente
-    st.markdown(
-        f"""
-<div class="detail-card">
-  <h2 style="margin-top:0;">Dados do Paciente</h2>
-  {format_field(nome_paciente, "Nome")}
-  {format_field(paciente.get("nascimento", ""), "Nascimento")}
-  {format_field(paciente.get("celular", "") or paciente.get("telefone", ""), "Celular")}
-  {format_field(paciente.get("telefone_residencial", ""), "Telefone Residencial")}
-  {format_field(paciente.get("email", ""), "E-mail")}
-  {format_field(paciente.get("profissao", ""), "Profissão")}
-  {format_field(paciente.get("cpf", ""), "CPF")}
-  {format_field(paciente.get("endereco", ""), "Endereço")}
-  {format_field(paciente.get("cidade_estado", ""), "Cidade/Estado")}
-  {format_field(paciente.get("cep", ""), "CEP")}
-  {format_field(paciente.get("observacao", ""), "Observação")}
-  {format_field(paciente.get("como_conheceu", ""), "Como conheceu")}
-</div>
-""",
-        unsafe_allow_html=True,
-    )
 
+    with profile_phase("html"):
+        valores = tuple(
+            next((paciente.get(campo) for campo in campos if paciente.get(campo)), paciente.get(campos[0], ""))
+            for _, campos in DETAIL_FIELDS
+        )
+        detalhe_html = memo_fragment(("detalhe", paciente.get("id"), nome_paciente, valores), lambda: detail_card_html(nome_paciente, valores))
+    with profile_phase("markdown"):
+        destino.markdown(detalhe_html, unsafe_allow_html=True)
+
+def render_prontuarios(prontuarios: List[Dict[str, Any]], pdf_link_base: str = "") -> None:
+    """
+    Prontuários abaixo do card do paciente, ocupando a página.
+    Com pdf_link_base (modo lazy), PDFs ainda não resolvidos apontam para
+    "<pdf_link_base>&pdf=<classe>", que resolve a URL só quando clicado.
+    """
     st.subheader("Prontuários")
     if not prontuarios:
         st.info("Nenhum prontuário encontrado para este paciente.")
     else:
-        # Ordena os prontuários por data (mais recente primeiro)
-        prontuarios_ordenados = sorted(prontuarios, key=lambda x: x.get("data", ""), reverse=True)
-        
-        # Cria cards para os prontuários
-        html_parts = ['<div class="prontuarios-section">', '<div class="cards-grid">']
-        for prontuario in prontuarios_ordenados:
-            data = prontuario.get("data", "")
-            historico = prontuario.get("historico", "")
-            tipo_doc = prontuario.get("tipo_doc", "")
-            classe = prontuario.get("classe", "")
-            
-            # Formata a data para exibição mais amigável
-            data_formatada = data
-            if data and "T" in data:
-                try:
-                    dt = datetime.fromisoformat(data.replace("Z", "+00:00"))
-                    data_formatada = dt.strftime("%d/%m/%Y %H:%M")
-                except:
-                    data_formatada = data
-            
-            # Cria o card do prontuário
-            card_html = f"""
-<div class="card">
-  <div class="row"><span class="label">Data:</span> {data_formatada}</div>
-  <div class="row"><span class="label">Histórico:</span> <div style="margin-top: 5px; line-height: 1.4;">{historico}</div></div>
-"""
-            
-            # Adiciona link para PDF se for um documento PDF; caso contrário, informa indisponibilidade
-            if tipo_doc == "pdf" and classe:
-                pdf_link = prontuario.get("pdf_url", "")
-                if pdf_link:
-                    card_html += f'<div class="row"><span class="label">Documento:</span> <a href="{pdf_link}" target="_blank" rel="noopener">📄 Visualizar PDF</a></div>'
-                else:
-                    card_html += '<div class="row"><span class="label">Documento:</span> <span class="empty">PDF não disponível</span></div>'
-            
-            card_html += "</div>"
-            html_parts.append(card_html)
-            
-        html_parts.append("</div>")
-        html_parts.append("</div>")
-        
-        st.markdown("\n".join(html_parts), unsafe_allow_html=True)
+        with profile_phase("html"):
+            itens = tuple(
+                (p.get("data", ""), p.get("historico", ""), p.get("tipo_doc", ""), p.get("classe", ""), p.get("pdf_url", ""))
+                for p in prontuarios
+            )
+            html = memo_fragment(("prontuarios", itens, pdf_link_base), lambda: prontuarios_html(itens, pdf_link_base))
+        with profile_phase("markdown"):
+            st.markdown(html, unsafe_allow_html=True)
 
 def render_cards(pacientes: List[Dict[str, Any]]):
     """Renderiza cards dos pacientes em grid responsivo."""
@@ -1072,30 +2804,252 @@ def render_cards(pacientes: List[Dict[str, Any]]):
         st.info("Nenhum paciente encontrado.")
         return
 
-    html_parts = ['<div class="cards-grid">']
-    for p in pacientes:
-        nome = p.get("nome", "")
-        tel = p.get("celular", "") or p.get("telefone", "")  # Fallback para compatibilidade
-        email = p.get("email", "")
-        html_parts.append(textwrap.dedent(f"""
-<div class="card">
-  <a class="overlay-link" href="./?id={p.get('id')}" target="_self" rel="noopener" tabindex="-1" aria-hidden="true"></a>
-  <h3>{nome}</h3>
-  <div class="row"><span class="label">Telefone:</span> {tel}</div>
-  <div class="row"><span class="label">E-mail:</span> {email}</div>
+    with profile_phase("html"):
+        html = cards_html(pacientes)
+
+    with profile_phase("markdown"):
+        st.markdown(html, unsafe_allow_html=True)
+
+def render_pagination(search_query: str, meta: Dict[str, Any]) -> None:
+    """Paginação por links ?page= (LIST_MODE=pages), prefetch das páginas vizinhas e seletor rápido."""
+    # Controles de navegação entre páginas - sem colunas (evita quebra em telas estreitas)
+    if meta.get('total_pages', 1) > 1:
+        st.markdown("---")
+        st.markdown("<div style='height: 12px;'></div>", unsafe_allow_html=True)
+
+    current_page_num = int(meta.get('page', 1))
+    total_pages = int(meta.get('total_pages', 1))
+    current_nome = st.query_params.get("nome", "") or search_query
+    base_query = f"&nome={quote(current_nome.strip())}" if current_nome and current_nome.strip() else ""
+
+    prev_link = f"?page={current_page_num - 1}{base_query}" if current_page_num > 1 else ""
+    next_link = f"?page={current_page_num + 1}{base_query}" if current_page_num < total_pages else ""
+
+    page_text = (
+        f"Página {current_page_num}"
+        if total_pages <= 1 else f"Página {current_page_num} de {total_pages}"
+    )
+
+    with profile_phase("html"):
+        pagination_html = f"""
+<div class='pagination-container' style='margin-top: 14px; padding: 0;'>
+  <div class='pagination-inline'>
+    {('<span class="pagination-btn disabled">◀</span>' if current_page_num <= 1 else f'<a class="pagination-btn" href="{prev_link}" target="_self">◀</a>')}
+    <div class='pagination-info'>{page_text}</div>
+    {('<span class="pagination-btn disabled">▶</span>' if not next_link else f'<a class="pagination-btn" href="{next_link}" target="_self">▶</a>')}
+  </div>
 </div>
-""" ).strip())
-    html_parts.append("</div>")
+"""
+    with profile_phase("markdown"):
+        st.markdown(pagination_html, unsafe_allow_html=True)
+
+    # Aquece o cache das páginas vizinhas para que ◀/▶ sejam cache hits
+    if API_URL and not meta.get("source"):
+        if current_page_num < total_pages:
+            submit_background(fetch_patients, API_URL, search_query, current_page_num + 1)
+        if current_page_num > 1:
+            submit_background(fetch_patients, API_URL, search_query, current_page_num - 1)
+    
+    # Seletor rápido de página (apenas se houver muitas páginas)
+    if meta.get('total_pages', 1) > 10:
+        st.markdown('<div class="quick-page-selector">', unsafe_allow_html=True)
+        st.markdown('<div class="page-selector-title">Ir para página específica:</div>', unsafe_allow_html=True)
+        
+        col_a, col_b, col_c = st.columns([1, 1, 1])
+        
+        with col_a:
+            target_page = st.number_input("Página", min_value=1, max_value=meta.get('total_pages', 1), value=meta.get('page', 1), key="target_page")
+        
+        with col_b:
+            if st.button("Ir para página", help="Navegar para a página selecionada", key="go_to_page"):
+                st.query_params["page"] = target_page
+                st.rerun()
+        
+        st.markdown("</div>", unsafe_allow_html=True)
 
-    st.markdown("\n".join(html_parts), unsafe_allow_html=True)
+PATIENT_LIST_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "patient_list")
+NAVIGATION_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "navigation")
+
+def apply_session_navigation() -> None:
+    """
+    NAV_MODE=session: aplica em st.query_params o link interno clicado (cards,
+    paginação, PDFs) e renderiza o componente que intercepta esses cliques. Deve
+    rodar antes de qualquer leitura de st.query_params no rerun.
+    """
+    evento = st.session_state.get("navigation")
+    if evento and evento.get("seq") != st.session_state.get("navigation_seq"):
+        st.session_state["navigation_seq"] = evento.get("seq")
+        st.query_params.from_dict(dict(parse_qsl(evento.get("query", ""))))
+    components.declare_component("navigation", path=NAVIGATION_COMPONENT_DIR)(key="navigation", default=None)
+
+@st.cache_resource(show_spinner=False)
+def get_search_executor() -> ThreadPoolExecutor:
+    """Pool das buscas da listagem: o script espera o resultado sem ficar preso na requisição."""
+    return ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+def wait_interruptible(futuro: Any) -> None:
+    """
+    Espera o futuro terminar em fatias curtas. Cada fatia atualiza um placeholder
+    vazio, ponto em que o Streamlit interrompe o script se já houver um rerun mais
+    novo na fila (ex.: outra busca confirmada). Na interrupção, o futuro é
+    cancelado se ainda estiver na fila do pool; se já começou, o resultado, quando
+    chegar, só aquece o cache.
+    """
+    marcador = st.empty()
+    try:
+        while not futuro.done():
+            marcador.empty()
+            wait([futuro], timeout=0.1)
+    except BaseException:
+        # RerunException/StopException do Streamlit (BaseException) ou erro no script
+        futuro.cancel()
+        raise
+
+def refine_previous_search(nome: str, page: int) -> Any:
+    """
+    Refinamento de uma busca completa anterior ("Mar" -> "Mari"): se a busca
+    anterior coube numa página só e o novo termo a estende, o resultado é o
+    subconjunto já em memória. Retorna (pacientes, meta) ou None.
+    """
+    anterior = st.session_state.get("search_complete")
+    termo = normalize(nome)
+    if not anterior or time.monotonic() - anterior["at"] > API_CACHE_TTL:
+        return None
+    if len(termo) <= len(anterior["query"]) or not termo.startswith(anterior["query"]):
+        return None
+    encontrados = [p for p in anterior["pacientes"] if termo in normalize(p.get("nome", ""))]
+    total_pages = max(1, (len(encontrados) + PAGE_SIZE - 1) // PAGE_SIZE)
+    inicio = (page - 1) * PAGE_SIZE
+    meta = {"query": nome, "total": len(encontrados), "version": anterior["version"], "page": page, "total_pages": total_pages, "source": "refinement"}
+    return encontrados[inicio:inicio + PAGE_SIZE], meta
+
+def list_page_cached(nome: str, page: int) -> bool:
+    """
+    Se fetch_patients(API_URL, nome, page) responde sem esperar a API: resposta
+    guardada (fresca, ou velha e revalidando em segundo plano), circuito aberto
+    ou modo mock. Toda resposta no st.cache_data também está no response_cache.
+    """
+    if not API_URL or api_circuit_open():
+        return True
+    idade = response_cache_age(fetch_patients, API_URL, nome, page)
+    return 0 <= idade <= API_CACHE_TTL + API_CACHE_MAX_STALE
+
+def load_list_page(nome: str, page: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Uma página da listagem: do índice local, se pronto; do resultado completo da
+    busca anterior, se o termo só foi refinado; do cache, direto; ou da API
+    (guardando os registros para o detalhe). Só a espera pela API passa pelo
+    pool de buscas, interrompível por um rerun mais novo: uma página em cache não
+    fica na fila atrás das buscas lentas de outras sessões.
+    """
+    if LOCAL_INDEX and API_URL and ensure_patient_index(API_URL):
+        return search_patients_local(nome, page)
+    refinado = refine_previous_search(nome, page)
+    if refinado is not None:
+        pacientes, meta = refinado
+    else:
+        if list_page_cached(nome, page):
+            pacientes, meta = fetch_patients(API_URL, nome, page)
+        else:
+            with st.spinner("Buscando pacientes..."):
+                ctx = get_script_run_ctx()
+
+                def _buscar():
+                    attach_background_ctx(ctx)
+                    return fetch_patients(API_URL, nome, page)
+
+                futuro = get_search_executor().submit(_buscar)
+                wait_interruptible(futuro)
+                pacientes, meta = futuro.result()
+        remember_patients(pacientes)
+        if page == 1 and not meta.get("error") and meta.get("total", 0) <= len(pacientes):
+            # Resultado completo: base para os refinamentos seguintes deste termo
+            st.session_state["search_complete"] = {"query": normalize(nome), "pacientes": pacientes, "version": meta.get("version", ""), "at": time.monotonic()}
+    return pacientes, meta
+
+def render_patient_scroll(search_query: str, pacientes: List[Dict[str, Any]], meta: Dict[str, Any]) -> None:
+    """
+    Lista virtualizada (LIST_MODE=scroll): um componente que desenha só os cards
+    visíveis e, ao chegar perto do fim, pede a próxima página pelo próprio
+    websocket da sessão. Cada pedido é um rerun que busca uma página e a acrescenta
+    às já carregadas (em session_state), sem recarregar a página nem a sessão.
+    Ao componente vai só o trecho a partir de "offset" (a página nova), não a
+    lista acumulada; se ele não tiver os anteriores (iframe recriado), pede
+    "sincronizar" com o que tem e recebe o restante.
+    """
+    lista = st.session_state.get("scroll_list")
+    if lista is None or lista["query"] != search_query:
+        lista = {
+            "query": search_query,
+            "pacientes": list(pacientes),
+            "page": int(meta.get("page", 1)),
+            "total_pages": int(meta.get("total_pages", 1)),
+            "total": meta.get("total", len(pacientes)),
+            "offset": 0,
+        }
+        st.session_state["scroll_list"] = lista
+
+    # O último valor do componente continua em session_state; seq evita repetir o mesmo pedido
+    falhou = False
+    evento = st.session_state.get("patient_list")
+    if evento and evento.get("seq") != st.session_state.get("patient_list_seq"):
+        st.session_state["patient_list_seq"] = evento.get("seq")
+        if evento.get("acao") == "abrir" and evento.get("id"):
+            st.query_params["id"] = str(evento["id"])
+            st.rerun()
+        elif evento.get("acao") in ("mais", "sincronizar"):
+            # O componente já tem os "carregados" primeiros: daqui em diante é o que falta enviar
+            lista["offset"] = min(int(evento.get("carregados") or 0), len(lista["pacientes"]))
+            if evento.get("acao") == "mais" and lista["page"] < lista["total_pages"]:
+                with profile_phase("fetch"):
+                    novos, meta_nova = load_list_page(search_query, lista["page"] + 1)
+                if meta_nova.get("error"):
+                    # Página e total ficam como estavam: o componente pode pedir de novo
+                    falhou = True
+                else:
+                    lista["pacientes"].extend(novos)
+                    lista["page"] = int(meta_nova.get("page", lista["page"] + 1))
+                    lista["total_pages"] = int(meta_nova.get("total_pages", lista["total_pages"]))
+
+    # Aquece a página seguinte para que o próximo pedido do componente seja um cache hit
+    if API_URL and not meta.get("source") and lista["page"] < lista["total_pages"]:
+        submit_background(fetch_patients, API_URL, search_query, lista["page"] + 1)
+
+    with profile_phase("html"):
+        cards = [
+            {"id": p.get("id"), "nome": p.get("nome", ""), "celular": p.get("celular", ""), "email": p.get("email", "")}
+            for p in lista["pacientes"][lista["offset"]:]
+        ]
+    with profile_phase("markdown"):
+        components.declare_component("patient_list", path=PATIENT_LIST_COMPONENT_DIR)(
+            pacientes=cards,
+            offset=lista["offset"],
+            total=lista["total"],
+            ha_mais=lista["page"] < lista["total_pages"],
+            erro=falhou,
+            consulta=search_query,
+            key="patient_list",
+            default=None,
+        )
 
 # ---------------------------
 # UI
 # ---------------------------
 st.title("Pacientes Dra. Carolina Adorno")
 
+# Links internos sem recarregar a página (a URL continua compartilhável)
+if NAV_MODE == "session":
+    apply_session_navigation()
+
+# Página de métricas, só com o token configurado em ADMIN_TOKEN (comparado em bytes:
+# compare_digest recusa str não ASCII, e um ?admin= com acento derrubaria a página)
+if ADMIN_TOKEN and hmac.compare_digest(st.query_params.get("admin", "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+    render_admin_page()
+    st.stop()
+
 # Verifica se há um paciente selecionado via ?id=
-selected_id = get_selected_paciente_id()
+with profile_phase("url"):
+    selected_id = get_selected_paciente_id()
 
 # Evita limpeza agressiva de cache quando não há paciente selecionado
 if not selected_id:
@@ -1108,17 +3062,42 @@ if selected_id:
     except Exception:
         selected_id_int = selected_id
 
-    paciente = fetch_patient_by_id(API_URL, selected_id_int)
-    if not paciente:
-        pacientes_tmp, _ = fetch_patients(API_URL, "")
-        paciente = next((p for p in pacientes_tmp if str(p.get("id")) == str(selected_id_int)), None)
+    render_detail_back_button()
+    # Paciente já visto na listagem: o card sai antes de qualquer requisição
+    cabecalho = st.empty()
+    conhecido = get_known_patient(selected_id_int)
+    if conhecido:
+        render_patient_header(cabecalho, conhecido)
+
+    with st.spinner("Carregando prontuários..." if conhecido else "Carregando dados do paciente..."), profile_phase("fetch"):
+        # Usa o ID original da URL, não o ID retornado pela API
+        paciente, prontuarios, paciente_api = fetch_patient_detail(API_URL, selected_id_int)
 
     if paciente:
-        with st.spinner("Carregando dados do paciente..."):
-            # Usa o ID original da URL, não o ID retornado pela API
-            prontuarios, paciente_api = fetch_prontuarios(API_URL, selected_id_int)
-        render_patient_detail(paciente, prontuarios, paciente_api)
+        render_patient_header(cabecalho, paciente, paciente_api)
+        with st.spinner("Carregando documentos..."), profile_phase("fetch"):
+            # Resolvido fora do cache de fetch_prontuarios para que um PDF lento não fique cacheado sem link
+            pdf_link_base = ""
+            pdf_solicitado = ""
+            pdf_url_solicitado = ""
+            if PDF_LINK_MODE == "eager":
+                resolve_pdf_urls(API_URL, prontuarios)
+            elif API_URL:
+                # Modo lazy: só o PDF clicado é resolvido; o primeiro paint não depende da quantidade de PDFs
+                pdf_link_base = f"./?id={quote(str(selected_id))}"
+                pdf_solicitado = st.query_params.get("pdf", "")
+                pdf_url_solicitado = resolve_requested_pdf(API_URL, prontuarios, pdf_solicitado)
+        if pdf_solicitado:
+            if pdf_url_solicitado:
+                st.link_button("📄 Abrir PDF solicitado", pdf_url_solicitado)
+            else:
+                st.warning("Não foi possível obter o link deste PDF.")
+        idade_txt = describe_cache_age(response_cache_age(fetch_patient_by_id, API_URL, selected_id_int))
+        if idade_txt:
+            st.caption(idade_txt.capitalize())
+        render_prontuarios(prontuarios, pdf_link_base=pdf_link_base)
     else:
+        cabecalho.empty()
         st.warning("Paciente não encontrado.")
 else:
     # Limpa cache da sessão quando não há paciente selecionado
@@ -1143,27 +3122,7 @@ else:
     if "last_search_query" not in st.session_state:
         st.session_state["last_search_query"] = (st.session_state.get("search_q", "") or "").strip()
     # Só reseta para página 1 quando o valor realmente muda
-    new_query = (st.session_state.get("search_q", "") or "").strip()
-    prev_query = st.session_state.get("last_search_query", default_nome or "")
-    if new_query != prev_query:
-        if new_query:
-            st.query_params["nome"] = new_query
-        else:
-            try:
-                del st.query_params["nome"]
-            except Exception:
-                pass
-            try:
-                del st.query_params["page"]
-            except Exception:
-                pass
-        # Remove qualquer id ativo ao alterar a busca para evitar reabrir prontuário
-        try:
-            del st.query_params["id"]
-        except Exception:
-            pass
-        st.query_params["page"] = 1
-        st.session_state["last_search_query"] = new_query
+    handle_search_change()
 
     # Busca dados na API conforme o texto e página (auto-aplica ao digitar)
     # Se não há texto digitado, tenta pegar da URL
@@ -1171,64 +3130,65 @@ else:
     # (Sincronização de URL já tratada acima ao detectar mudança de texto)
     
     # Obtém a página atual da URL
-    current_page = 1
-    url_page = st.query_params.get("page", "1")
-    try:
-        current_page = int(url_page) if url_page.isdigit() else 1
-    except:
+    with profile_phase("url"):
         current_page = 1
-    
-    with st.spinner("Buscando pacientes..."):
-        pacientes, meta = fetch_patients(API_URL, search_query, current_page)
+        url_page = st.query_params.get("page", "1")
+        try:
+            current_page = int(url_page) if url_page.isdigit() else 1
+        except:
+            current_page = 1
+        if LIST_MODE == "scroll":
+            # A lista virtualizada sempre começa da primeira página e acumula as seguintes
+            current_page = 1
+
+    # Com o índice local pronto, a busca é resolvida em memória; a API fica para o detalhe
+    with profile_phase("fetch"):
+        pacientes, meta = load_list_page(search_query, current_page)
     
     
-    st.caption(f"{meta.get('total', len(pacientes))} resultado(s) para “{meta.get('query', q or '')}”")
-
-    # Cards
-    render_cards(pacientes)
-
-    # Controles de navegação entre páginas - sem colunas (evita quebra em telas estreitas)
-    if meta.get('total_pages', 1) > 1:
-        st.markdown("---")
-        st.markdown("<div style='height: 12px;'></div>", unsafe_allow_html=True)
-
-    current_page_num = int(meta.get('page', 1))
-    total_pages = int(meta.get('total_pages', 1))
-    current_nome = st.query_params.get("nome", "") or search_query
-    base_query = f"&nome={quote(current_nome.strip())}" if current_nome and current_nome.strip() else ""
-
-    prev_link = f"?page={current_page_num - 1}{base_query}" if current_page_num > 1 else ""
-    next_link = f"?page={current_page_num + 1}{base_query}"
-
-    page_text = (
-        f"Página {current_page_num}"
-        if total_pages <= 1 else f"Página {current_page_num} de {total_pages}"
-    )
+    resultado_txt = f"{meta.get('total', len(pacientes))} resultado(s) para “{meta.get('query', q or '')}”"
+    if not meta.get("source"):
+        idade_txt = describe_cache_age(response_cache_age(fetch_patients, API_URL, search_query, current_page))
+        if idade_txt:
+            resultado_txt += f" · {idade_txt}"
+    st.caption(resultado_txt)
+
+    # Exportação de todos os pacientes da busca atual (gerada só sob demanda)
+    col_formato, col_exportar = st.columns([1, 1])
+    with col_formato:
+        formato = st.selectbox("Formato", list(EXPORT_FORMATS), key="export_format", label_visibility="collapsed")
+    with col_exportar:
+        if st.button("📥 Exportar todos", help="Gera um arquivo com todos os pacientes desta busca", key="export_btn"):
+            gerar, extensao, mime = EXPORT_FORMATS[formato]
+            st.session_state.pop("export_file", None)
+            try:
+                with st.spinner("Gerando arquivo..."):
+                    arquivo = gerar(iter_all_patients(API_URL, search_query))
+            except ExportIncompleteError as exc:
+                record_fetch_error("iter_all_patients", exc)
+                st.error("Não foi possível buscar todos os pacientes na API; o arquivo não foi gerado. Tente novamente.")
+            else:
+                st.session_state["export_file"] = {"query": search_query, "formato": formato, "data": arquivo, "extensao": extensao, "mime": mime}
+    export = st.session_state.get("export_file")
+    if export and (export["query"], export["formato"]) != (search_query, formato):
+        # Arquivo gerado para outra busca/formato: descarta
+        export = None
+        st.session_state.pop("export_file", None)
+    if export is not None:
+        st.download_button(
+            "⬇️ Baixar arquivo",
+            data=export["data"],
+            file_name=f"pacientes_{datetime.now():%Y%m%d}.{export['extensao']}",
+            mime=export["mime"],
+            key="export_download",
+        )
+
+    # Cards: grade paginada por links ou lista virtualizada com carga sob demanda
+    if LIST_MODE == "scroll":
+        render_patient_scroll(search_query, pacientes, meta)
+    else:
+        render_cards(pacientes)
+        render_pagination(search_query, meta)
 
-    pagination_html = f"""
-<div class='pagination-container' style='margin-top: 14px; padding: 0;'>
-  <div class='pagination-inline'>
-    {('<span class="pagination-btn disabled">◀</span>' if current_page_num <= 1 else f'<a class="pagination-btn" href="{prev_link}" target="_self">◀</a>')}
-    <div class='pagination-info'>{page_text}</div>
-    <a class='pagination-btn' href='{next_link}' target="_self">▶</a>
-  </div>
-</div>
-"""
-    st.markdown(pagination_html, unsafe_allow_html=True)
-    
-    # Seletor rápido de página (apenas se houver muitas páginas)
-    if meta.get('total_pages', 1) > 10:
-        st.markdown('<div class="quick-page-selector">', unsafe_allow_html=True)
-        st.markdown('<div class="page-selector-title">Ir para página específica:</div>', unsafe_allow_html=True)
-        
-        col_a, col_b, col_c = st.columns([1, 1, 1])
-        
-        with col_a:
-            target_page = st.number_input("Página", min_value=1, max_value=meta.get('total_pages', 1), value=meta.get('page', 1), key="target_page")
-        
-        with col_b:
-            if st.button("Ir para página", help="Navegar para a página selecionada", key="go_to_page"):
-                st.query_params["page"] = target_page
-                st.rerun()
-        
-        st.markdown("</div>", unsafe_allow_html=True)
+# Relatório do perfil do rerun (PROFILE / ?profile=), depois de tudo renderizado
+render_rerun_profile()
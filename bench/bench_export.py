@@ -0,0 +1,72 @@
+"""
+Benchmark dos formatos de exportação (Excel, CSV, Parquet) em função do número de linhas.
+
+Uso:
+    python bench/bench_export.py [--rows 1000 10000 100000] [--memory]
+
+Mede tempo de geração, tamanho do arquivo e (com --memory) o pico de memória
+Python via tracemalloc — que deixa a execução bem mais lenta, por isso é opcional.
+Os registros são sintéticos, no formato normalizado de fetch_patients.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+# Importa app.py em modo "bare" (sem `streamlit run`) e sem chamar a API real
+os.environ["API_URL"] = ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+
+
+def gerar_pacientes(n):
+    for i in range(n):
+        yield {
+            "id": i,
+            "nome": f"Paciente Número {i}",
+            "nascimento": "1985-03-15",
+            "celular": f"(31) 9{i % 10000:04d}-{i % 7919:04d}",
+            "telefone_residencial": "(31) 3333-4444",
+            "email": f"paciente.{i}@example.com",
+            "profissao": "Advogada",
+            "cpf": f"{i % 1000:03d}.456.789-00",
+            "endereco": f"Av. Brasil, {i % 5000}",
+            "cidade_estado": "Belo Horizonte/MG",
+            "cep": "30140-000",
+            "observacao": "Paciente assídua" if i % 3 else "",
+            "como_conheceu": "Indicação",
+        }
+
+
+def medir(funcao, n, memoria):
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    dados = funcao(gerar_pacientes(n))
+    duracao = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return duracao, len(dados), pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--memory", action="store_true", help="mede o pico de memória (tracemalloc)")
+    args = parser.parse_args()
+
+    print(f"{'formato':<20}{'linhas':>10}{'tempo (s)':>12}{'linhas/s':>12}{'tamanho (KB)':>15}{'pico (MB)':>12}")
+    for n in args.rows:
+        for rotulo, (funcao, _, _) in app.EXPORT_FORMATS.items():
+            duracao, tamanho, pico = medir(funcao, n, args.memory)
+            pico_txt = f"{pico / 1e6:.1f}" if pico is not None else "-"
+            print(f"{rotulo:<20}{n:>10}{duracao:>12.2f}{n / duracao:>12.0f}{tamanho / 1024:>15.0f}{pico_txt:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark da normalização de pacientes (PATIENT_SCHEMA) em payloads grandes.
+
+Uso:
+    python bench/bench_normalize.py [--items 10000] [--repeat 5]
+
+Compara, sobre o mesmo payload sintético (com itens no formato antigo:
+"telefone" no lugar de "celular", cidade/estado ausentes):
+    json            só o json.loads do payload, como referência de custo
+    schema          normalize_patients (getters por campo montados do PATIENT_SCHEMA)
+    laço manual     o laço por item que existia em fetch_patients
+    pandas          versão colunar (DataFrame -> registros), para comparação
+Os resultados das três normalizações são conferidos entre si.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+# Importa app.py em modo "bare" (sem `streamlit run`) e sem chamar a API real
+os.environ["API_URL"] = ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+from stub_api import gerar_pacientes  # noqa: E402
+
+
+def gerar_payload(n):
+    itens = gerar_pacientes(n)
+    for i, item in enumerate(itens):
+        if i % 3 == 0:
+            item["telefone"] = item.pop("celular")
+        if i % 5 == 0:
+            item["cidade_estado"] = f"{item.pop('cidade')}/{item.pop('estado')}"
+        if i % 7 == 0:
+            item["email"] = None
+    return json.dumps({"items": itens, "total": n})
+
+
+def laco_manual(items):
+    """Cópia do laço que fetch_patients usava antes do schema."""
+    normalized = []
+    for item in items:
+        cidade = item.get("cidade", "")
+        estado = item.get("estado", "")
+        if cidade and estado:
+            cidade_estado = f"{cidade}/{estado}"
+        elif cidade:
+            cidade_estado = cidade
+        elif estado:
+            cidade_estado = estado
+        else:
+            cidade_estado = item.get("cidade_estado", "")
+        normalized.append({
+            "id": item.get("id"),
+            "nome": item.get("nome") or "",
+            "nascimento": item.get("nascimento") or "",
+            "celular": item.get("celular") or item.get("telefone", "") or "",
+            "telefone_residencial": item.get("telefone_residencial") or "",
+            "email": item.get("email") or "",
+            "profissao": item.get("profissao") or "",
+            "cpf": item.get("cpf") or "",
+            "endereco": item.get("endereco") or "",
+            "cidade_estado": cidade_estado,
+            "cep": item.get("cep") or "",
+            "observacao": item.get("observacao") or "",
+            "como_conheceu": item.get("como_conheceu") or "",
+        })
+    return normalized
+
+
+def pandas_colunar(items):
+    """O mesmo schema aplicado coluna a coluna com pandas."""
+    df = pd.DataFrame.from_records(items)
+    vazio = pd.Series([None] * len(df), index=df.index, dtype=object)
+
+    def coluna(nome):
+        if nome not in df:
+            return vazio
+        serie = df[nome].astype(object)
+        return serie.where(serie.notna() & (serie != ""), None)
+
+    colunas = {}
+    for campo, fontes in app.PATIENT_SCHEMA:
+        resultado = vazio
+        for fonte in fontes:
+            if isinstance(fonte, tuple):
+                partes = [coluna(c) for c in fonte]
+                juntas = partes[0]
+                for parte in partes[1:]:
+                    ambas = juntas.notna() & parte.notna()
+                    juntas = juntas.where(~ambas, juntas.astype(str) + "/" + parte.astype(str)).combine_first(parte)
+                serie = juntas
+            else:
+                serie = coluna(fonte)
+            resultado = resultado.combine_first(serie)
+        colunas[campo] = resultado if campo in app.PATIENT_RAW_FIELDS else resultado.where(resultado.notna(), "")
+    return pd.DataFrame(colunas).to_dict("records")
+
+
+def medir(funcao, repeticoes):
+    melhor, resultado = float("inf"), None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5, help="repetições (vale a melhor)")
+    args = parser.parse_args()
+
+    payload = gerar_payload(args.items)
+    items = json.loads(payload)["items"]
+    casos = [
+        ("json", lambda: json.loads(payload)),
+        ("schema", lambda: app.normalize_patients(items)),
+        ("laço manual", lambda: laco_manual(items)),
+        ("pandas", lambda: pandas_colunar(items)),
+    ]
+
+    print(f"{'caso':<14}{'itens':>8}{'tempo (ms)':>12}{'itens/s':>12}")
+    resultados = {}
+    for nome, funcao in casos:
+        duracao, resultados[nome] = medir(funcao, args.repeat)
+        print(f"{nome:<14}{args.items:>8}{duracao * 1000:>12.1f}{args.items / duracao:>12.0f}")
+    iguais = resultados["schema"] == resultados["laço manual"] == resultados["pandas"]
+    print("resultados idênticos" if iguais else "ATENÇÃO: resultados divergem")
+
+
+if __name__ == "__main__":
+    main()
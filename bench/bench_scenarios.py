@@ -0,0 +1,219 @@
+"""
+Benchmark de ponta a ponta do app contra a API falsa (bench/stub_api.py).
+
+Cada cenário roda o app.py inteiro numa sessão headless (AppTest), como um
+rerun de verdade, e mede a duração de cada rerun:
+    busca       digitação do termo, uma letra por rerun ("M", "Ma", ...)
+    paginacao   ◀/▶ pelas primeiras páginas da listagem
+    detalhe     abertura do detalhe de pacientes com N PDFs (modo lazy e eager)
+    exportacao  "Exportar todos" da listagem completa
+
+Uso:
+    python bench/bench_scenarios.py [--scenarios busca paginacao detalhe exportacao]
+        [--patients 2000] [--pdfs 30] [--latency 0.1] [--jitter 0.02] [--error-rate 0]
+        [--warm] [--save base.json] [--compare base.json] [--api http://...]
+
+Por padrão os caches (st.cache_data / st.cache_resource) são limpos antes de cada
+cenário; --warm mantém o que os cenários anteriores aqueceram. Com --save o
+resultado vira uma linha de base; --compare mostra a variação contra ela.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import requests
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_api import start_stub  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+CENARIOS = ("busca", "paginacao", "detalhe", "exportacao")
+
+
+def percentil(valores, p):
+    """Percentil pelo método nearest-rank."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+class Contador:
+    """Lê os contadores da API falsa, em processo ou via GET /_stats."""
+
+    def __init__(self, api, stats=None):
+        self.api = api
+        self.stats = stats
+
+    def snapshot(self):
+        if self.stats is not None:
+            return self.stats.snapshot()
+        try:
+            return requests.get(f"{self.api}/_stats", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return {"counts": {}, "errors": 0}
+
+    def reset(self):
+        if self.stats is not None:
+            self.stats.reset()
+            return
+        try:
+            requests.post(f"{self.api}/_reset", timeout=5)
+        except requests.RequestException:
+            pass
+
+    def wait_idle(self):
+        if self.stats is not None:
+            self.stats.wait_idle()
+        else:
+            time.sleep(1.0)
+
+
+def nova_sessao():
+    return AppTest.from_file(APP_PATH, default_timeout=300)
+
+
+def rerun(at, duracoes):
+    inicio = time.perf_counter()
+    at.run()
+    duracoes.append((time.perf_counter() - inicio) * 1000)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+
+def cenario_busca(args):
+    at = nova_sessao()
+    at.run()
+    duracoes = []
+    for i in range(1, len(args.query) + 1):
+        at.text_input(key="search_q").input(args.query[:i])
+        rerun(at, duracoes)
+    return duracoes
+
+
+def cenario_paginacao(args):
+    at = nova_sessao()
+    duracoes = []
+    for pagina in range(1, args.pages + 1):
+        at.query_params["page"] = str(pagina)
+        rerun(at, duracoes)
+    return duracoes
+
+
+def cenario_detalhe(args, modo):
+    os.environ["PDF_LINK_MODE"] = modo
+    at = nova_sessao()
+    duracoes = []
+    try:
+        for paciente_id in range(1, args.details + 1):
+            at.query_params["id"] = str(paciente_id)
+            rerun(at, duracoes)
+    finally:
+        os.environ.pop("PDF_LINK_MODE", None)
+    return duracoes
+
+
+def cenario_exportacao(args):
+    at = nova_sessao()
+    at.run()
+    at.selectbox(key="export_format").set_value(args.export_format)
+    at.run()
+    duracoes = []
+    at.button(key="export_btn").click()
+    rerun(at, duracoes)
+    return duracoes
+
+
+def rodar_cenarios(args, contador):
+    disponiveis = {
+        "busca": [("busca", lambda: cenario_busca(args))],
+        "paginacao": [("paginacao", lambda: cenario_paginacao(args))],
+        "detalhe": [("detalhe_lazy", lambda: cenario_detalhe(args, "lazy")),
+                    ("detalhe_eager", lambda: cenario_detalhe(args, "eager"))],
+        "exportacao": [("exportacao", lambda: cenario_exportacao(args))],
+    }
+    execucoes = [execucao for cenario in args.scenarios for execucao in disponiveis[cenario]]
+
+    resultados = {}
+    for nome, executar in execucoes:
+        if not args.warm:
+            st.cache_data.clear()
+            st.cache_resource.clear()
+        contador.wait_idle()
+        contador.reset()
+        duracoes = executar()
+        # Prefetch em segundo plano também conta como custo do cenário
+        contador.wait_idle()
+        stats = contador.snapshot()
+        resultados[nome] = {
+            "reruns": len(duracoes),
+            "p50_ms": round(percentil(duracoes, 50), 1),
+            "p95_ms": round(percentil(duracoes, 95), 1),
+            "max_ms": round(max(duracoes), 1),
+            "requisicoes": sum(stats.get("counts", {}).values()),
+            "por_endpoint": stats.get("counts", {}),
+            "erros_simulados": stats.get("errors", 0),
+        }
+    return resultados
+
+
+def imprimir(resultados, base=None):
+    print(f"{'cenário':<16}{'reruns':>8}{'p50 (ms)':>11}{'p95 (ms)':>11}{'máx (ms)':>11}{'requisições':>13}  por endpoint")
+    for nome, r in resultados.items():
+        endpoints = ", ".join(f"{k}={v}" for k, v in sorted(r["por_endpoint"].items()))
+        print(f"{nome:<16}{r['reruns']:>8}{r['p50_ms']:>11.1f}{r['p95_ms']:>11.1f}{r['max_ms']:>11.1f}{r['requisicoes']:>13}  {endpoints}")
+        if base and nome in base:
+            b = base[nome]
+            delta = lambda atual, anterior: f"{(atual - anterior) / anterior * 100:+.0f}%" if anterior else "-"
+            print(f"{'  vs. base':<16}{'':>8}{delta(r['p50_ms'], b['p50_ms']):>11}{delta(r['p95_ms'], b['p95_ms']):>11}"
+                  f"{delta(r['max_ms'], b['max_ms']):>11}{delta(r['requisicoes'], b['requisicoes']):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument("--api", default="", help="usa uma API já rodando (ex.: bench/stub_api.py) em vez de subir uma")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--pdfs", type=int, default=30, help="PDFs por paciente no cenário de detalhe")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--query", default="Maria", help="termo digitado no cenário de busca")
+    parser.add_argument("--pages", type=int, default=10, help="páginas percorridas na paginação")
+    parser.add_argument("--details", type=int, default=5, help="pacientes abertos no cenário de detalhe")
+    parser.add_argument("--export-format", default="CSV (.csv)")
+    parser.add_argument("--warm", action="store_true", help="não limpa os caches entre cenários")
+    parser.add_argument("--save", default="", help="grava o resultado em JSON (linha de base)")
+    parser.add_argument("--compare", default="", help="compara com um JSON gravado por --save")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    if args.api:
+        api, contador = args.api.rstrip("/"), Contador(args.api.rstrip("/"))
+    else:
+        _, api, _, stats = start_stub(
+            patients=args.patients, pdfs=args.pdfs, latency=args.latency,
+            jitter=args.jitter, error_rate=args.error_rate,
+        )
+        contador = Contador(api, stats)
+    os.environ["API_URL"] = api
+
+    resultados = rodar_cenarios(args, contador)
+    base = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+    imprimir(resultados, base)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
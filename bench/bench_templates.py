@@ -0,0 +1,219 @@
+"""
+Micro-benchmark da geração de HTML dos cards e do detalhe (templates + memorização).
+
+Uso:
+    python bench/bench_templates.py [--cards 1000] [--prontuarios 30] [--repeat 20]
+
+Compara, sobre os mesmos pacientes sintéticos:
+    cards antigo      f-string + textwrap.dedent por card (como render_cards fazia)
+    cards frio        cards_html com a memória de fragmentos vazia
+    cards quente      cards_html de novo com o mesmo conteúdo (rerun sem mudança)
+    cards 1 alterado  mesma página com um único paciente alterado
+    detalhe antigo    format_field + strptime/fromisoformat a cada rerun
+    detalhe frio / quente   detail_card_html + prontuarios_html via memo_fragment
+O HTML gerado pelas versões novas é conferido contra o da antiga.
+"""
+import argparse
+import logging
+import os
+import sys
+import textwrap
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+# Importa app.py em modo "bare" (sem `streamlit run`) e sem chamar a API real
+os.environ["API_URL"] = ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+from stub_api import gerar_pacientes  # noqa: E402
+
+# Sem o Runtime do Streamlit, st.cache_resource não guarda nada: fixa as instâncias
+# compartilhadas como o servidor faria
+_fragmentos, _datas = app.get_html_fragments(), app.get_date_formatters()
+app.get_html_fragments = lambda: _fragmentos
+app.get_date_formatters = lambda: _datas
+
+
+def cards_antigo(pacientes):
+    """Cópia do laço que render_cards usava antes dos templates."""
+    html_parts = ['<div class="cards-grid">']
+    for p in pacientes:
+        nome = p.get("nome", "")
+        tel = p.get("celular", "") or p.get("telefone", "")
+        email = p.get("email", "")
+        html_parts.append(textwrap.dedent(f"""
+<div class="card">
+  <a class="overlay-link" href="./?id={p.get('id')}" target="_self" rel="noopener" tabindex="-1" aria-hidden="true"></a>
+  <h3>{nome}</h3>
+  <div class="row"><span class="label">Telefone:</span> {tel}</div>
+  <div class="row"><span class="label">E-mail:</span> {email}</div>
+</div>
+""").strip())
+    html_parts.append("</div>")
+    return "\n".join(html_parts)
+
+
+def detalhe_antigo(paciente, prontuarios, pdf_link_base):
+    """Cópia da montagem do detalhe antes dos templates (card + prontuários)."""
+    def format_field(value, field_name):
+        if value:
+            if field_name == "Nascimento" and isinstance(value, str):
+                try:
+                    if " " in value:
+                        value = datetime.strptime(value.split(" ")[0], "%Y-%m-%d").strftime("%d/%m/%Y")
+                    elif "T" in value:
+                        value = datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%d/%m/%Y")
+                except ValueError:
+                    pass
+            return f'<div class="row"><span class="label">{field_name}:</span> <span class="value">{value}</span></div>'
+        return f'<div class="row"><span class="label">{field_name}:</span> <span class="empty">-</span></div>'
+
+    detalhe_html = f"""
+<div class="detail-card">
+  <h2 style="margin-top:0;">Dados do Paciente</h2>
+  {format_field(paciente.get("nome", ""), "Nome")}
+  {format_field(paciente.get("nascimento", ""), "Nascimento")}
+  {format_field(paciente.get("celular", "") or paciente.get("telefone", ""), "Celular")}
+  {format_field(paciente.get("telefone_residencial", ""), "Telefone Residencial")}
+  {format_field(paciente.get("email", ""), "E-mail")}
+  {format_field(paciente.get("profissao", ""), "Profissão")}
+  {format_field(paciente.get("cpf", ""), "CPF")}
+  {format_field(paciente.get("endereco", ""), "Endereço")}
+  {format_field(paciente.get("cidade_estado", ""), "Cidade/Estado")}
+  {format_field(paciente.get("cep", ""), "CEP")}
+  {format_field(paciente.get("observacao", ""), "Observação")}
+  {format_field(paciente.get("como_conheceu", ""), "Como conheceu")}
+</div>
+"""
+    html_parts = ['<div class="prontuarios-section">', '<div class="cards-grid">']
+    for prontuario in sorted(prontuarios, key=lambda x: x.get("data", ""), reverse=True):
+        data = prontuario.get("data", "")
+        classe = prontuario.get("classe", "")
+        data_formatada = data
+        if data and "T" in data:
+            try:
+                data_formatada = datetime.fromisoformat(data.replace("Z", "+00:00")).strftime("%d/%m/%Y %H:%M")
+            except ValueError:
+                pass
+        card_html = f"""
+<div class="card">
+  <div class="row"><span class="label">Data:</span> {data_formatada}</div>
+  <div class="row"><span class="label">Histórico:</span> <div style="margin-top: 5px; line-height: 1.4;">{prontuario.get("historico", "")}</div></div>
+"""
+        if prontuario.get("tipo_doc", "") == "pdf" and classe:
+            pdf_link = prontuario.get("pdf_url", "")
+            if pdf_link:
+                card_html += f'<div class="row"><span class="label">Documento:</span> <a href="{pdf_link}" target="_blank" rel="noopener">📄 Visualizar PDF</a></div>'
+            elif pdf_link_base:
+                card_html += f'<div class="row"><span class="label">Documento:</span> <a href="{pdf_link_base}&pdf={quote(classe)}" target="_self">📄 Visualizar PDF</a></div>'
+            else:
+                card_html += '<div class="row"><span class="label">Documento:</span> <span class="empty">PDF não disponível</span></div>'
+        card_html += "</div>"
+        html_parts.append(card_html)
+    html_parts.append("</div>")
+    html_parts.append("</div>")
+    return detalhe_html, "\n".join(html_parts)
+
+
+def detalhe_novo(paciente, prontuarios, pdf_link_base):
+    """Mesma montagem de render_patient_header + render_prontuarios, sem o st.markdown."""
+    valores = tuple(
+        next((paciente.get(campo) for campo in campos if paciente.get(campo)), paciente.get(campos[0], ""))
+        for _, campos in app.DETAIL_FIELDS
+    )
+    nome = paciente.get("nome", "")
+    detalhe = app.memo_fragment(("detalhe", paciente.get("id"), nome, valores), lambda: app.detail_card_html(nome, valores))
+    itens = tuple(
+        (p.get("data", ""), p.get("historico", ""), p.get("tipo_doc", ""), p.get("classe", ""), p.get("pdf_url", ""))
+        for p in prontuarios
+    )
+    return detalhe, app.memo_fragment(("prontuarios", itens, pdf_link_base), lambda: app.prontuarios_html(itens, pdf_link_base))
+
+
+def gerar_prontuarios(n):
+    prontuarios = []
+    for i in range(n):
+        prontuario = {
+            "data": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:{i % 60:02d}:00",
+            "historico": f"Consulta {i + 1}: retorno em 30 dias",
+            "tipo_doc": "pdf" if i % 4 else "texto",
+            "classe": f"paciente1_doc{i + 1}.pdf",
+        }
+        if i % 3 == 0:
+            prontuario["pdf_url"] = f"https://files.example.com/paciente1_doc{i + 1}.pdf"
+        prontuarios.append(prontuario)
+    return prontuarios
+
+
+def medir(funcao, repeticoes, antes=None):
+    melhor, resultado = float("inf"), None
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def limpar():
+    with _fragmentos["lock"]:
+        _fragmentos["fragments"].clear()
+    for formatador in _datas.values():
+        formatador.cache_clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=1000)
+    parser.add_argument("--prontuarios", type=int, default=30, help="prontuários no cenário de detalhe")
+    parser.add_argument("--repeat", type=int, default=20, help="repetições (vale a melhor)")
+    args = parser.parse_args()
+    app.HTML_FRAGMENTS_MAX = max(app.HTML_FRAGMENTS_MAX, 2 * args.cards + 10)
+
+    pacientes = app.normalize_patients(gerar_pacientes(args.cards))
+    alterados = [dict(p) for p in pacientes]
+    alterados[len(alterados) // 2]["email"] = "alterado@example.com"
+    paciente = dict(pacientes[0], nascimento="1985-03-15 00:00:00")
+    prontuarios = gerar_prontuarios(args.prontuarios)
+    base = "./?id=1"
+
+    def aquecer_cards():
+        limpar()
+        app.cards_html(pacientes)
+
+    def aquecer_detalhe():
+        limpar()
+        detalhe_novo(paciente, prontuarios, base)
+
+    casos = [
+        ("cards antigo", lambda: cards_antigo(pacientes), None),
+        ("cards frio", lambda: app.cards_html(pacientes), limpar),
+        ("cards quente", lambda: app.cards_html(pacientes), aquecer_cards),
+        ("cards 1 alterado", lambda: app.cards_html(alterados), aquecer_cards),
+        ("detalhe antigo", lambda: detalhe_antigo(paciente, prontuarios, base), None),
+        ("detalhe frio", lambda: detalhe_novo(paciente, prontuarios, base), limpar),
+        ("detalhe quente", lambda: detalhe_novo(paciente, prontuarios, base), aquecer_detalhe),
+    ]
+
+    print(f"{'caso':<18}{'tempo (µs)':>12}{'vs. antigo':>12}")
+    resultados, referencia = {}, {}
+    for nome, funcao, antes in casos:
+        duracao, resultados[nome] = medir(funcao, args.repeat, antes)
+        grupo = nome.split()[0]
+        referencia.setdefault(grupo, duracao)
+        print(f"{nome:<18}{duracao * 1e6:>12.0f}{referencia[grupo] / duracao:>11.1f}x")
+
+    iguais = (
+        resultados["cards antigo"] == resultados["cards frio"] == resultados["cards quente"]
+        and resultados["cards 1 alterado"] == cards_antigo(alterados)
+        and resultados["detalhe antigo"] == resultados["detalhe frio"] == resultados["detalhe quente"]
+    )
+    print("HTML idêntico ao antigo" if iguais else "ATENÇÃO: HTML diverge do antigo")
+
+
+if __name__ == "__main__":
+    main()
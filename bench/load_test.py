@@ -0,0 +1,269 @@
+"""
+Teste de carga: várias sessões simultâneas contra um servidor Streamlit de
+verdade, percorrendo o fluxo busca → página → detalhe com a API falsa
+(bench/stub_api.py) por trás.
+
+Uso:
+    python bench/load_test.py [--users 20] [--duration 30] [--patients 2000]
+        [--pdfs 30] [--latency 0.1] [--jitter 0.02] [--error-rate 0] [--api http://...]
+
+O servidor Streamlit sobe neste mesmo processo (como `streamlit run app.py`)
+e cada usuário virtual é um cliente websocket que fala o protocolo do
+navegador: abre uma sessão nova e pede um rerun por etapa, com a query string
+que os links da página produzem (?nome=, ?page=, ?id=). AppTest não serve
+aqui: ele usa um Runtime global por execução e não roda sessões em paralelo.
+
+Relata:
+- vazão (fluxos e reruns por segundo) e latência p50/p95/p99 por etapa;
+- crescimento de memória por categoria do provedor de estatísticas do
+  Streamlit (st.cache_data, st.cache_resource, session state...) e o pico de RSS;
+- saturação do pool de conexões do HTTPAdapter de get_http_session: conexões em
+  uso (amostradas), fração do tempo com o pool cheio e conexões descartadas
+  por "Connection pool is full".
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.runtime import Runtime
+from streamlit.web import bootstrap
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_scenarios import percentil  # noqa: E402
+from stub_api import NOMES, start_stub  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+ETAPAS = ("abertura", "busca", "pagina", "detalhe")
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memoria_por_categoria():
+    """Bytes por categoria do provedor de estatísticas do Runtime (o mesmo de /_stcore/metrics)."""
+    totais = {}
+    for stat in Runtime.instance().stats_mgr.get_stats():
+        totais[stat.category_name] = totais.get(stat.category_name, 0) + stat.byte_length
+    return totais
+
+
+class ContadorPoolCheio(logging.Handler):
+    """Conta os avisos do urllib3 de conexão descartada por pool cheio."""
+
+    def __init__(self):
+        super().__init__()
+        self.descartes = 0
+
+    def emit(self, record):
+        if "Connection pool is full" in record.getMessage():
+            self.descartes += 1
+
+
+class MonitorPool(threading.Thread):
+    """Amostra as conexões em uso nos pools da sessão HTTP do app."""
+
+    def __init__(self, intervalo=0.02):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.amostras = 0
+        self.cheio = 0
+        self.max_em_uso = 0
+        self.tamanho = 0
+
+    def sessao_do_app(self):
+        # get_http_session vive no st.cache_resource do app; é a única sessão com keep-alive explícito
+        for obj in gc.get_objects():
+            if isinstance(obj, requests.Session) and obj.headers.get("Connection") == "keep-alive":
+                return obj
+        return None
+
+    def run(self):
+        sessao = None
+        while not self.parar.is_set():
+            if sessao is None:
+                sessao = self.sessao_do_app()
+            if sessao is not None:
+                adapter = sessao.get_adapter("http://")
+                for pool in list(adapter.poolmanager.pools._container.values()):
+                    if pool.pool is None:
+                        continue
+                    self.tamanho = pool.pool.maxsize
+                    em_uso = pool.pool.maxsize - pool.pool.qsize()
+                    self.amostras += 1
+                    self.max_em_uso = max(self.max_em_uso, em_uso)
+                    if em_uso >= pool.pool.maxsize:
+                        self.cheio += 1
+            self.parar.wait(self.intervalo)
+
+
+class Sessao:
+    """Um cliente websocket do Streamlit: uma aba do navegador."""
+
+    def __init__(self, porta):
+        self.porta = porta
+        self.ws = None
+
+    async def abrir(self):
+        url = f"ws://127.0.0.1:{self.porta}/_stcore/stream"
+        self.ws = await websocket_connect(HTTPRequest(url, headers={"Origin": f"http://127.0.0.1:{self.porta}"}))
+
+    async def rerun(self, query_string):
+        """Pede um rerun e espera o script terminar. Retorna se houve exceção no script."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = query_string
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        erro = False
+        while True:
+            dados = await self.ws.read_message()
+            if dados is None:
+                raise ConnectionError("websocket fechado pelo servidor")
+            resposta = ForwardMsg()
+            resposta.ParseFromString(dados)
+            tipo = resposta.WhichOneof("type")
+            if tipo == "delta" and resposta.delta.new_element.WhichOneof("type") == "exception":
+                erro = True
+            if tipo == "script_finished" and resposta.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return erro
+
+    def fechar(self):
+        if self.ws is not None:
+            self.ws.close()
+
+
+async def usuario(args, porta, prazo, duracoes, seed):
+    """Um usuário virtual: repete o fluxo completo numa sessão nova até o prazo."""
+    rnd = random.Random(seed)
+    fluxos = erros = 0
+    while time.time() < prazo:
+        termo = quote(rnd.choice(NOMES)[:rnd.randint(2, 5)])
+        etapas = [
+            ("abertura", ""),
+            ("busca", f"nome={termo}&page=1"),
+            ("pagina", f"nome={termo}&page=2"),
+            ("detalhe", f"id={rnd.randint(1, args.patients)}"),
+        ]
+        sessao = Sessao(porta)
+        await sessao.abrir()
+        try:
+            for etapa, query_string in etapas:
+                inicio = time.perf_counter()
+                erros += await sessao.rerun(query_string)
+                duracoes[etapa].append((time.perf_counter() - inicio) * 1000)
+        finally:
+            sessao.fechar()
+        fluxos += 1
+    return fluxos, erros
+
+
+async def carga(args, porta):
+    duracoes = {etapa: [] for etapa in ETAPAS}
+    prazo = time.time() + args.duration
+    resultados = await asyncio.gather(*(usuario(args, porta, prazo, duracoes, i) for i in range(args.users)))
+    return duracoes, sum(r[0] for r in resultados), sum(r[1] for r in resultados)
+
+
+def relatorio(args, duracoes, fluxos, erros, decorrido, memoria_ini, memoria_fim, monitor, pool_cheio):
+    reruns = sum(len(v) for v in duracoes.values())
+    print(f"{args.users} sessões, {decorrido:.1f} s: {fluxos} fluxos ({fluxos / decorrido:.2f}/s), "
+          f"{reruns} reruns ({reruns / decorrido:.2f}/s), {erros} com exceção")
+    print(f"{'etapa':<12}{'n':>6}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'máx (ms)':>11}")
+    for etapa in ETAPAS:
+        valores = duracoes[etapa]
+        if valores:
+            print(f"{etapa:<12}{len(valores):>6}{percentil(valores, 50):>11.1f}{percentil(valores, 95):>11.1f}"
+                  f"{percentil(valores, 99):>11.1f}{max(valores):>11.1f}")
+    print("memória por categoria (MB):")
+    for categoria in sorted(set(memoria_ini) | set(memoria_fim)):
+        antes, depois = memoria_ini.get(categoria, 0) / 1e6, memoria_fim.get(categoria, 0) / 1e6
+        print(f"  {categoria:<28}{antes:>9.2f} → {depois:>9.2f}")
+    print(f"pico de RSS do processo: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    if monitor.amostras:
+        print(f"pool HTTP: máx. {monitor.max_em_uso}/{monitor.tamanho} conexões em uso, "
+              f"cheio em {100 * monitor.cheio / monitor.amostras:.1f}% das amostras, "
+              f"{pool_cheio.descartes} conexões descartadas (pool cheio)")
+    else:
+        print("pool HTTP: sessão requests não usada (HTTP_CLIENT=async?)")
+
+
+def conduzir(args, porta, pool_cheio):
+    """Thread do gerador de carga; o servidor Streamlit ocupa a thread principal."""
+    try:
+        limite = time.time() + 60
+        while time.time() < limite:
+            try:
+                if requests.get(f"http://127.0.0.1:{porta}/_stcore/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+
+        memoria_ini = memoria_por_categoria()
+        monitor = MonitorPool()
+        monitor.start()
+        inicio = time.time()
+        duracoes, fluxos, erros = asyncio.run(carga(args, porta))
+        decorrido = time.time() - inicio
+        monitor.parar.set()
+        relatorio(args, duracoes, fluxos, erros, decorrido, memoria_ini, memoria_por_categoria(), monitor, pool_cheio)
+    finally:
+        sys.stdout.flush()
+        os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="sessões simultâneas")
+    parser.add_argument("--duration", type=float, default=30, help="duração do teste (s)")
+    parser.add_argument("--api", default="", help="usa uma API já rodando em vez de subir a falsa")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--pdfs", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.api:
+        api = args.api.rstrip("/")
+    else:
+        _, api, _, _ = start_stub(
+            patients=args.patients, pdfs=args.pdfs, latency=args.latency,
+            jitter=args.jitter, error_rate=args.error_rate,
+        )
+    os.environ["API_URL"] = api
+
+    porta = porta_livre()
+    opcoes = {
+        "server.port": porta,
+        "server.address": "127.0.0.1",
+        "server.headless": True,
+        "server.fileWatcherType": "none",
+        "browser.gatherUsageStats": False,
+        "logger.level": "error",
+    }
+    bootstrap.load_config_options(flag_options=opcoes)
+    pool_cheio = ContadorPoolCheio()
+    logging.getLogger("urllib3.connectionpool").addHandler(pool_cheio)
+    threading.Thread(target=conduzir, args=(args, porta, pool_cheio), daemon=True).start()
+    bootstrap.run(APP_PATH, False, [], opcoes)
+
+
+if __name__ == "__main__":
+    main()
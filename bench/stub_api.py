@@ -0,0 +1,259 @@
+"""
+API falsa para benchmarks: implementa /pacientes, /pacientes/prontuarios,
+/pdfs/download e /pdfs/download/batch com latência, taxa de erro e tamanho do
+conjunto de dados configuráveis. Conta as requisições por endpoint.
+/pacientes aceita ?limit= e ?cursor= (keyset pelo id) e devolve total_pages e next_cursor;
+com --fixed-page N, responde como a API antiga (páginas de N itens, só items/total/version).
+
+Uso:
+    python bench/stub_api.py [--port 8765] [--patients 500] [--pdfs 30]
+                             [--latency 0.2] [--jitter 0.05] [--error-rate 0.0]
+                             [--no-batch] [--fixed-page 25]
+
+Endpoints auxiliares: GET /_stats (contadores) e POST /_reset (zera contadores).
+Também pode ser iniciada em thread por outro script via start_stub(...).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NOMES = ["Maria", "Ana", "João", "José", "Marcos", "Mariana", "Carolina", "Pedro", "Paula", "Lucas", "Luana", "Beatriz"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Costa", "Almeida", "Ferreira", "Rodrigues", "Gomes"]
+CIDADES = [("Belo Horizonte", "MG"), ("Contagem", "MG"), ("São Paulo", "SP"), ("Rio de Janeiro", "RJ")]
+
+
+class StubConfig:
+    """Parâmetros da API falsa; podem ser alterados com o servidor rodando."""
+
+    def __init__(self, patients=500, pdfs=30, latency=0.2, jitter=0.0, error_rate=0.0, batch=True, seed=42, fixed_page=0):
+        self.patients = patients
+        self.pdfs = pdfs
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.batch = batch
+        self.fixed_page = fixed_page  # > 0: ignora ?limit= e ?cursor= (API antiga, páginas fixas)
+        self.random = random.Random(seed)
+        self.dataset = gerar_pacientes(patients, seed)
+
+
+def gerar_pacientes(n, seed=42):
+    rnd = random.Random(seed)
+    pacientes = []
+    for i in range(1, n + 1):
+        cidade, estado = rnd.choice(CIDADES)
+        pacientes.append({
+            "id": i,
+            "nome": f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {rnd.choice(SOBRENOMES)}",
+            "nascimento": f"19{rnd.randint(50, 99)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "celular": f"(31) 9{rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}",
+            "telefone_residencial": "",
+            "email": f"paciente{i}@example.com",
+            "profissao": "",
+            "cpf": f"{rnd.randint(100, 999)}.{rnd.randint(100, 999)}.{rnd.randint(100, 999)}-{rnd.randint(10, 99)}",
+            "endereco": f"Rua {rnd.choice(SOBRENOMES)}, {rnd.randint(1, 2000)}",
+            "cidade": cidade,
+            "estado": estado,
+            "cep": f"30{rnd.randint(100, 999)}-000",
+            "observacao": "",
+            "como_conheceu": "Indicação",
+        })
+    return pacientes
+
+
+class StubStats:
+    """Contadores por endpoint e requisições em andamento (para esperar a API ficar ociosa)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.errors = 0
+        self.inflight = 0
+        self.last_activity = time.time()
+
+    def begin(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            self.inflight += 1
+            self.last_activity = time.time()
+
+    def end(self):
+        with self.lock:
+            self.inflight -= 1
+            self.last_activity = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            return {"counts": dict(self.counts), "errors": self.errors, "inflight": self.inflight}
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.errors = 0
+
+    def wait_idle(self, quiet=0.5, timeout=30.0):
+        """Espera não haver requisições em andamento por `quiet` segundos (prefetch em segundo plano)."""
+        limite = time.time() + timeout
+        while time.time() < limite:
+            with self.lock:
+                ocioso = self.inflight == 0 and time.time() - self.last_activity >= quiet
+            if ocioso:
+                return True
+            time.sleep(0.05)
+        return False
+
+
+def make_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, obj, code=200):
+            corpo = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _simular(self):
+            """Latência e erros configurados; retorna True se respondeu com erro."""
+            time.sleep(max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter)))
+            if config.error_rate and config.random.random() < config.error_rate:
+                with stats.lock:
+                    stats.errors += 1
+                self._json({"detail": "erro simulado"}, 503)
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = parse_qs(url.query)
+            if url.path == "/_stats":
+                return self._json(stats.snapshot())
+            stats.begin(url.path)
+            try:
+                if self._simular():
+                    return
+                if url.path == "/pacientes":
+                    return self._pacientes(q)
+                if url.path == "/pacientes/prontuarios":
+                    return self._prontuarios(q)
+                if url.path == "/pdfs/download":
+                    arquivo = q.get("arquivo", [""])[0]
+                    return self._json({"download_info": {"url": f"https://files.example.com/{arquivo}"}})
+                self._json({"detail": "Not Found"}, 404)
+            finally:
+                stats.end()
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            corpo = self.rfile.read(tamanho) if tamanho else b""
+            if url.path == "/_reset":
+                stats.reset()
+                return self._json({"ok": True})
+            stats.begin(url.path)
+            try:
+                if url.path != "/pdfs/download/batch" or not config.batch:
+                    return self._json({"detail": "Not Found"}, 404)
+                if self._simular():
+                    return
+                arquivos = json.loads(corpo or b"{}").get("arquivos", [])
+                self._json({"items": [
+                    {"arquivo": a, "download_info": {"url": f"https://files.example.com/{a}"}} for a in arquivos
+                ]})
+            finally:
+                stats.end()
+
+        def _pacientes(self, q):
+            if "id" in q:
+                pid = q["id"][0]
+                return self._json({"items": [p for p in config.dataset if str(p["id"]) == pid]})
+            nome = q.get("nome", [""])[0].strip().lower()
+            page = max(1, int(q.get("page", ["1"])[0] or 1))
+            limit = max(1, int(q.get("limit", ["25"])[0] or 25))
+            encontrados = [p for p in config.dataset if nome in p["nome"].lower()]
+            if config.fixed_page:
+                inicio = (page - 1) * config.fixed_page
+                return self._json({
+                    "items": encontrados[inicio:inicio + config.fixed_page],
+                    "query": nome,
+                    "total": len(encontrados),
+                    "version": "stub",
+                })
+            cursor = q.get("cursor", [""])[0]
+            if cursor:
+                # Keyset: itens depois do último id da página anterior (o conjunto está ordenado por id)
+                restantes = [p for p in encontrados if p["id"] > int(cursor)]
+            else:
+                restantes = encontrados[(page - 1) * limit:]
+            pagina = restantes[:limit]
+            self._json({
+                "items": pagina,
+                "query": nome,
+                "total": len(encontrados),
+                "limit": limit,
+                "total_pages": max(1, (len(encontrados) + limit - 1) // limit),
+                "next_cursor": str(pagina[-1]["id"]) if len(restantes) > limit else None,
+                "version": "stub",
+            })
+
+        def _prontuarios(self, q):
+            pid = q.get("id", [""])[0]
+            paciente = next((p for p in config.dataset if str(p["id"]) == pid), {"id": pid, "nome": ""})
+            prontuarios = [
+                {
+                    "data": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00",
+                    "historico": f"Consulta {i + 1}",
+                    "tipo_doc": "pdf",
+                    "classe": f"paciente{pid}_doc{i + 1}.pdf",
+                }
+                for i in range(config.pdfs)
+            ]
+            self._json({"paciente": paciente, "prontuarios": prontuarios})
+
+    return Handler
+
+
+def start_stub(port=0, **kwargs):
+    """Sobe a API falsa numa thread daemon. Retorna (servidor, url_base, config, stats)."""
+    config = StubConfig(**kwargs)
+    stats = StubStats()
+    servidor = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config, stats))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="stub-api", daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}", config, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--patients", type=int, default=500, help="tamanho do conjunto de pacientes")
+    parser.add_argument("--pdfs", type=int, default=30, help="prontuários em PDF por paciente")
+    parser.add_argument("--latency", type=float, default=0.2, help="latência base por requisição (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variação uniforme da latência (± s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 503")
+    parser.add_argument("--no-batch", action="store_true", help="responde 404 em /pdfs/download/batch")
+    parser.add_argument("--fixed-page", type=int, default=0, help="páginas fixas de N itens, ignorando ?limit= e ?cursor=")
+    args = parser.parse_args()
+
+    config = StubConfig(args.patients, args.pdfs, args.latency, args.jitter, args.error_rate, not args.no_batch,
+                        fixed_page=args.fixed_page)
+    stats = StubStats()
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config, stats))
+    print(f"API falsa em http://127.0.0.1:{args.port} ({args.patients} pacientes, {args.pdfs} PDFs cada)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
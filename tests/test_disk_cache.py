@@ -0,0 +1,50 @@
+"""
+DiskCache: arquivo só legível pelo dono e tamanho total mantido em memória.
+
+Uso:
+    python -m pytest -q tests
+"""
+import logging
+import os
+import stat
+import sys
+
+# Importa app.py em modo "bare" (sem `streamlit run`) e sem chamar a API real
+os.environ["API_URL"] = ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+
+
+def permissao(caminho):
+    return stat.S_IMODE(os.stat(caminho).st_mode)
+
+
+def test_arquivo_criado_e_corrigido_com_0600(tmp_path):
+    caminho = tmp_path / "cache.sqlite"
+    mascara = os.umask(0o022)
+    try:
+        cache = app.DiskCache(str(caminho), 1_000_000)
+        cache.set("k", {"cpf": "123.456.789-00"})
+        for arquivo in tmp_path.iterdir():
+            assert permissao(arquivo) == 0o600, arquivo.name
+
+        # Arquivo antigo, criado com a permissão padrão: corrigido ao abrir
+        os.chmod(caminho, 0o644)
+        app.DiskCache(str(caminho), 1_000_000)
+        assert permissao(caminho) == 0o600
+    finally:
+        os.umask(mascara)
+
+
+def test_total_em_memoria_acompanha_o_sqlite(tmp_path):
+    cache = app.DiskCache(str(tmp_path / "cache.sqlite"), 20_000)
+    for i in range(100):
+        cache.set(f"k{i % 30}", "x" * (100 + i * 10))
+        if i % 7 == 0:
+            cache.delete(f"k{(i + 3) % 30}")
+        assert cache._total == cache._sum_sizes()
+    assert cache._total <= 20_000
+
+    # Reaberto, parte da soma já gravada
+    assert app.DiskCache(str(tmp_path / "cache.sqlite"), 20_000)._total == cache._total
@@ -0,0 +1,101 @@
+"""
+Resolução das URLs de PDF contra a API falsa (bench/stub_api.py), com e sem o
+endpoint em lote /pdfs/download/batch.
+
+Uso:
+    python -m pytest -q tests
+"""
+import os
+import re
+import sys
+import time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+from stub_api import start_stub  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+PDFS = 5
+
+
+@pytest.fixture
+def api(request, monkeypatch):
+    """Sobe a API falsa no modo pedido (batch=True/False) e aponta o app para ela."""
+    servidor, url, _, stats = start_stub(patients=10, pdfs=PDFS, latency=0.0, batch=request.param)
+    monkeypatch.setenv("API_URL", url)
+    monkeypatch.setenv("PDF_LINK_MODE", "eager")
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    yield stats
+    servidor.shutdown()
+
+
+def abrir_detalhe(paciente_id):
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.query_params["id"] = str(paciente_id)
+    at.run()
+    assert not at.exception
+    html = "".join(m.value for m in at.markdown if "prontuarios-section" in m.value and "<style>" not in m.value)
+    return re.findall(r'href="(https://[^"]+)" target="_blank"', html)
+
+
+def urls_esperadas(paciente_id):
+    return sorted(f"https://files.example.com/pdfs/paciente{paciente_id}_doc{i}.pdf" for i in range(1, PDFS + 1))
+
+
+@pytest.mark.parametrize("api", [True], indirect=True)
+def test_lote_resolve_todos_os_pdfs_numa_chamada(api):
+    assert sorted(abrir_detalhe(1)) == urls_esperadas(1)
+    contagem = api.snapshot()["counts"]
+    assert contagem.get("/pdfs/download/batch") == 1
+    assert contagem.get("/pdfs/download", 0) == 0
+
+
+@pytest.mark.parametrize("api", [False], indirect=True)
+def test_sem_lote_cai_para_consultas_individuais(api):
+    assert sorted(abrir_detalhe(1)) == urls_esperadas(1)
+    contagem = api.snapshot()["counts"]
+    assert contagem.get("/pdfs/download/batch") == 1  # sondado uma vez (404)
+    assert contagem.get("/pdfs/download") == PDFS
+
+    # O lote sem suporte fica lembrado: o próximo detalhe vai direto às consultas individuais
+    api.reset()
+    assert sorted(abrir_detalhe(2)) == urls_esperadas(2)
+    contagem = api.snapshot()["counts"]
+    assert contagem.get("/pdfs/download/batch", 0) == 0
+    assert contagem.get("/pdfs/download") == PDFS
+
+
+@pytest.mark.parametrize("api", [False], indirect=True)
+def test_sem_lote_com_cliente_assincrono(api, monkeypatch):
+    monkeypatch.setenv("HTTP_CLIENT", "async")
+    assert sorted(abrir_detalhe(1)) == urls_esperadas(1)
+    assert api.snapshot()["counts"].get("/pdfs/download") == PDFS
+
+    # Reabrir o mesmo paciente usa as URLs já resolvidas pelo event loop
+    api.reset()
+    assert sorted(abrir_detalhe(1)) == urls_esperadas(1)
+    assert api.snapshot()["counts"].get("/pdfs/download", 0) == 0
+
+
+def test_lote_lento_respeita_o_prazo(monkeypatch):
+    servidor, url, config, stats = start_stub(patients=10, pdfs=PDFS, latency=0.0, batch=True)
+    monkeypatch.setenv("API_URL", url)
+    monkeypatch.setenv("PDF_LINK_MODE", "eager")
+    monkeypatch.setenv("PDF_URL_DEADLINE", "0.3")
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    try:
+        config.latency = 1.0
+        assert abrir_detalhe(1) == []  # o lote passou do prazo: o detalhe sai sem os links
+
+        time.sleep(1.2)
+        assert sorted(abrir_detalhe(1)) == urls_esperadas(1)  # o lote terminou no pool e ficou em cache
+        contagem = stats.snapshot()["counts"]
+        assert contagem.get("/pdfs/download/batch") == 1
+        assert contagem.get("/pdfs/download", 0) == 0
+    finally:
+        servidor.shutdown()
@@ -0,0 +1,43 @@
+"""
+Respostas de erro da API não ficam presas no st.cache_data: depois que a API
+volta, a sessão seguinte consulta de novo em vez de repetir a lista vazia.
+
+Uso:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import time
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+from stub_api import start_stub  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+
+
+def abrir_lista():
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    assert not at.exception
+    return [c.value for c in at.caption if "resultado(s)" in c.value]
+
+
+def test_erro_da_api_nao_fica_no_cache(monkeypatch):
+    servidor, url, config, stats = start_stub(patients=40, latency=0.0, error_rate=1.0)
+    monkeypatch.setenv("API_URL", url)
+    monkeypatch.setenv("CIRCUIT_RESET", "0.2")
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    try:
+        assert abrir_lista() == ["0 resultado(s) para “”"]
+
+        config.error_rate = 0.0
+        time.sleep(0.3)  # o circuito libera a sondagem
+        stats.reset()
+        assert abrir_lista() == ["40 resultado(s) para “”"]
+        assert stats.snapshot()["counts"].get("/pacientes", 0) >= 1
+    finally:
+        servidor.shutdown()
@@ -0,0 +1,64 @@
+"""
+Leituras completas de /pacientes (exportação e índice local) contra a API falsa
+no formato antigo, que ignora ?limit= e devolve páginas fixas só com items/total.
+
+Uso:
+    python -m pytest -q tests
+"""
+import logging
+import os
+import sys
+
+import pytest
+
+# Importa app.py em modo "bare" (sem `streamlit run`) e sem chamar a API real
+os.environ["API_URL"] = ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+from stub_api import start_stub  # noqa: E402
+
+PACIENTES = 1000
+PAGINA_FIXA = 25
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """API de páginas fixas e, como no servidor, uma única instância dos recursos compartilhados."""
+    servidor, url, _, stats = start_stub(patients=PACIENTES, latency=0.0, fixed_page=PAGINA_FIXA)
+    for getter in ("get_page_cursors", "get_patient_index"):
+        instancia = getattr(app, getter)()
+        monkeypatch.setattr(app, getter, lambda instancia=instancia: instancia)
+    yield url, stats
+    servidor.shutdown()
+
+
+def test_exportacao_le_todas_as_paginas_fixas(api):
+    url, stats = api
+    ids = [p["id"] for p in app.iter_all_patients(url, "")]
+    assert len(ids) == len(set(ids)) == PACIENTES
+    assert stats.snapshot()["counts"]["/pacientes"] == PACIENTES // PAGINA_FIXA
+
+
+def test_indice_carrega_todas_as_paginas_fixas(api):
+    url, _ = api
+    app.load_patient_index(url)
+    indice = app.get_patient_index()
+    assert indice["ready"]
+    assert len(indice["records"]) == PACIENTES
+
+
+def test_leitura_curta_nao_gera_arquivo_nem_indice(api, monkeypatch):
+    url, _ = api
+    original = app.load_patients_page
+
+    def sem_a_terceira_pagina(*args, **kwargs):
+        pacientes, meta = original(*args, **kwargs)
+        return ([] if meta["page"] == 3 else pacientes), meta
+
+    monkeypatch.setattr(app, "load_patients_page", sem_a_terceira_pagina)
+    with pytest.raises(app.ExportIncompleteError):
+        list(app.iter_all_patients(url, ""))
+    app.load_patient_index(url)
+    assert not app.get_patient_index()["ready"]